@@ -0,0 +1,489 @@
+'''
+Benchmarks for Wild Tiger Petter, run headless against the game's own
+classes.
+
+    python bench.py run -o baseline.json
+    python bench.py compare baseline.json
+    python bench.py compare baseline.json current.json --threshold 0.2
+
+run times every benchmark (or those matching --filter) and saves the
+results as JSON. compare checks a baseline against a saved run, or against
+a fresh run if none is given, and exits with status 1 if any benchmark got
+slower by more than the threshold.
+
+The memory benchmarks report the bytes each game object takes instead of
+a time. They are traced with tracemalloc, so they only run on Python 3.
+'''
+from __future__ import print_function
+import os
+import sys
+import gc
+import json
+import time
+import timeit
+import fnmatch
+import platform
+import argparse
+import subprocess
+import contextlib
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# no window and no sound; must be set before pygame initializes SDL
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame as pg
+import wtp
+
+MIN_TIME = 0.05  # seconds each timed repeat runs for at least
+REPEAT = 5  # timed repeats per benchmark; the fastest is reported
+THRESHOLD = 0.1  # fraction slower than the baseline counted as a regression
+SEED = 1  # world and random seed, so every run benchmarks the same game
+
+MATRIX_SIZES = (5, 11, 21)
+TIGER_COUNTS = (10, 100, 1000, 10000)
+PET_SESSION_TICKS = int(600 / wtp.TICK)  # ticks in ten minutes of petting
+MEMORY_COUNT = 10000  # objects created per memory benchmark
+IMPORT_TARGET = 0.005  # seconds import wtp should take, after its libraries
+UNITS = {'time': ('us', 1e6, 'faster'),  # unit, scale and word for a gain
+         'sample': ('us', 1e6, 'faster'),
+         'memory': ('B', 1, 'smaller')}
+
+BENCHMARKS = []
+
+
+def benchmark(name, params=(None,), kind='time'):
+    '''
+    Registers a benchmark setup function. The setup is called with each of
+    params and returns the function to time. For sample benchmarks the
+    function times something itself and returns the seconds it took, and
+    for memory benchmarks it creates the object to measure.
+    '''
+    def register(setup):
+        for param in params:
+            full_name = name if param is None else '{}[{}]'.format(name,
+                                                                  param)
+            BENCHMARKS.append((full_name, setup, param, kind))
+        return setup
+    return register
+
+
+@contextlib.contextmanager
+def quiet():
+    '''
+    Silences the game's progress prints while benchmarks run.
+    '''
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def seeded_world():
+    wtp.random.seed(SEED)
+    return wtp.World(SEED)
+
+
+def check_centered(matrix):
+    '''
+    Raises AssertionError unless a step there and back leaves matrix's
+    center tile where it was, as it does in the game. A matrix that is off
+    center repositions on every move, and its timings would be baselines
+    for a broken game.
+    '''
+    cell = matrix.center_tile.cell
+    with quiet():
+        matrix.move((1, 0))
+        moved = matrix.center_tile.cell
+        matrix.move((-1, 0))
+    if moved != cell or matrix.center_tile.cell != cell:
+        raise AssertionError('Stepping moved the center tile from {} to '
+                             '{}'.format(cell, moved))
+    return matrix
+
+
+def make_matrix(size, tigers=()):
+    return check_centered(wtp.TileMatrix(size, list(tigers), seeded_world(),
+                                         pos=wtp.init_matrix_pos(size)))
+
+
+def make_tigers(num_tigers):
+    wtp.random.seed(SEED)
+    tigers = wtp.TigerManager(num_tigers)
+    matrix = make_matrix(wtp.DEFAULT_TILE_MATRIX_SIZE, tigers.tigers_to_pet())
+    return tigers, matrix
+
+
+def pet_path(tiger):
+    '''
+    Returns mouse positions, one per tick, stroking at tiger's desired speed.
+    '''
+    step = int(tiger.desired_pet_speed * wtp.TICK)
+    path = [(x, wtp.CENTER_FRAME_Y) for x in range(100, 700, step)]
+    return path + path[::-1]
+
+
+def make_game(mode):
+    wtp.random.seed(SEED)
+    game = wtp.GameState(wtp.DEFAULT_TILE_MATRIX_SIZE, wtp.DEFAULT_NUM_TIGERS)
+    check_centered(game.tile_matrix)
+    game.keys = wtp.ScriptedKeys()
+    game.mouse = wtp.ScriptedMouse()
+    if mode == wtp.WALKING:
+        game.start_walking()
+        game.direction = wtp.DIRECTIONS[wtp.LEFT]
+    elif mode == wtp.PETTING:
+        game.tigers.start_petting(game.tigers.tigers_to_pet()[0])
+        game.start_petting()
+    return game
+
+
+##############################################
+# Benchmarks
+
+
+@benchmark('tile_matrix_init', MATRIX_SIZES)
+def bench_tile_matrix_init(size):
+    wtp.TILE_CACHE.preload()
+    return lambda: make_matrix(size)
+
+
+@benchmark('tile_matrix_move', MATRIX_SIZES)
+def bench_tile_matrix_move(size):
+    matrix = make_matrix(size)
+    return lambda: matrix.move((1, 0))
+
+
+@benchmark('tile_matrix_reposition', MATRIX_SIZES)
+def bench_tile_matrix_reposition(size):
+    matrix = make_matrix(size)
+    directions = [(1, 0), (-1, 0)]
+
+    def reposition():
+        directions.reverse()
+        matrix.reposition(directions[0])
+    return reposition
+
+
+@benchmark('tigers_collide', TIGER_COUNTS)
+def bench_tigers_collide(num_tigers):
+    tigers, matrix = make_tigers(num_tigers)
+    player = wtp.Player(pos=wtp.CENTER_FRAME_POS, alignment=wtp.CENTER)
+    return lambda: tigers.collide(player, matrix)
+
+
+@benchmark('tigers_update', TIGER_COUNTS)
+def bench_tigers_update(num_tigers):
+    tigers, matrix = make_tigers(num_tigers)
+    return lambda: tigers.update(matrix)
+
+
+@benchmark('tigers_draw', TIGER_COUNTS)
+def bench_tigers_draw(num_tigers):
+    tigers, matrix = make_tigers(num_tigers)
+    return lambda: tigers.draw(wtp.get_frame(), matrix)
+
+
+@benchmark('tigers_pet_session')
+def bench_tigers_pet_session(param):
+    '''
+    Pets one tiger at its desired speed for PET_SESSION_TICKS ticks.
+    '''
+    tigers, matrix = make_tigers(1)
+    tiger = tigers.tigers_to_pet()[0]
+    path = pet_path(tiger)
+
+    def session():
+        tigers.reset()
+        tigers.start_petting(tiger)
+        tigers.session.petting_time = float('inf')
+        for tick in range(PET_SESSION_TICKS):
+            now = tick * wtp.TICK
+            tigers.track_pet(path[tick % len(path)], True, now)
+            tigers.pet(now)
+    return session
+
+
+@benchmark('text_update', ('same', 'alternating'))
+def bench_text_update(kind):
+    text = wtp.Text('Total Score: 0', wtp.DEFAULT_FONT, wtp.BLUE, 20,
+                    pos=wtp.SCORE_COUNTER_POS)
+    strings = ['Total Score: 0', 'Total Score: 1']
+
+    def update():
+        if kind == 'alternating':
+            strings.reverse()
+        text.update(pos=wtp.SCORE_COUNTER_POS, string=strings[0])
+    return update
+
+
+@benchmark('load_tiles')
+def bench_load_tiles(param):
+    return lambda: wtp.TileCache(wtp.TILES_PATH).preload()
+
+
+@benchmark('load_sprites')
+def bench_load_sprites(param):
+    return lambda: wtp.SpriteAtlas().get(wtp.TIGER_SPRITE_KEY)
+
+
+@benchmark('decode_picture')
+def bench_decode_picture(param):
+    pictures = wtp.PictureCache()
+    filename = sorted(wtp.get_file_paths(wtp.TIGER_PICS_PATH))[0]
+    pictures.store([filename])
+    return lambda: pictures.decode(filename)
+
+
+@benchmark('game_frame', (wtp.MESSAGE, wtp.WALKING, wtp.PETTING))
+def bench_game_frame(mode):
+    '''
+    One frame of the game loop: events, a tick, drawing and presenting.
+    While petting, the mouse strokes the tiger at its desired speed.
+    '''
+    game = make_game(mode)
+    renderer = wtp.DirtyRenderer(wtp.get_frame())
+    if mode == wtp.PETTING:
+        game.tigers.session.petting_time = float('inf')
+        path = pet_path(game.tigers.tiger_to_pet)
+    ticks = [0]
+
+    def frame():
+        game.mode = mode
+        game.now += wtp.TICK
+        ticks[0] += 1
+        events = []
+        if mode == wtp.PETTING:
+            events.append(pg.event.Event(
+                pg.MOUSEMOTION, pos=path[ticks[0] % len(path)],
+                rel=(0, 0), buttons=(1, 0, 0)))
+        game.process_events(events)
+        game.update()
+        game.draw(renderer)
+        renderer.present()
+    return frame
+
+
+@benchmark('import_wtp', kind='sample')
+def bench_import_wtp(param):
+    '''
+    Imports wtp in a fresh interpreter that has already imported pygame and
+    NumPy, so only the game module's own import is timed. Its bytecode is
+    cached, as it is for players, even if this environment says not to.
+    '''
+    code = '\n'.join([
+        'import timeit, pygame',
+        'try:',
+        '    import numpy',
+        'except ImportError:',
+        '    pass',
+        'start = timeit.default_timer()',
+        'import wtp',
+        'print(timeit.default_timer() - start)'])
+    env = dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1')
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def sample():
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=here, env=env)
+        return float(output.split()[-1])
+    sample()
+    return sample
+
+
+@benchmark('img_obj_memory', kind='memory')
+def bench_img_obj_memory(param):
+    image = wtp.SPRITE_ATLAS.first(wtp.TIGER_SPRITE_KEY)
+    return lambda: wtp.ImgObj(image=image)
+
+
+@benchmark('tile_memory', kind='memory')
+def bench_tile_memory(param):
+    world = seeded_world()
+    world.tile_image((0, 0))
+    return lambda: wtp.Tile((0, 0), world, (0, 0))
+
+
+@benchmark('tiger_memory', kind='memory')
+def bench_tiger_memory(param):
+    '''
+    A tiger along with its roar Text.
+    '''
+    wtp.SPRITE_ATLAS.first(wtp.TIGER_SPRITE_KEY)
+    wtp.Tiger(None)
+    return lambda: wtp.Tiger(None)
+
+
+##############################################
+# Running and comparing
+
+
+def measure(func, min_time=MIN_TIME, repeat=REPEAT):
+    '''
+    Returns the best and median seconds per call of func over repeat
+    timings, each long enough to take at least min_time.
+    '''
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= min_time:
+            break
+        number *= max(2, int(min_time / max(elapsed, 1e-9)))
+    times = sorted(timeit.timeit(func, number=number) / number
+                   for i in range(repeat))
+    return {'best': times[0], 'median': times[len(times) // 2],
+            'number': number, 'repeat': repeat, 'kind': 'time'}
+
+
+def measure_samples(func, repeat=REPEAT):
+    '''
+    Returns the best and median of repeat samples taken by func.
+    '''
+    samples = sorted(func() for i in range(repeat))
+    return {'best': samples[0], 'median': samples[len(samples) // 2],
+            'number': 1, 'repeat': repeat, 'kind': 'sample'}
+
+
+def measure_memory(factory, count=MEMORY_COUNT):
+    '''
+    Returns the bytes allocated per object by count calls of factory, with
+    all of the objects kept alive. Shared images and caches are allocated
+    by the benchmark setup, so they aren't counted.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [factory() for i in range(count)]
+        allocated = (tracemalloc.get_traced_memory()[0] - before -
+                     sys.getsizeof(objects))
+    finally:
+        tracemalloc.stop()
+    return {'best': float(allocated) / len(objects), 'number': count,
+            'kind': 'memory'}
+
+
+def units(result):
+    return UNITS[result.get('kind', 'time')]
+
+
+def run(pattern='*', repeat=REPEAT):
+    # a frame the dummy driver doesn't scale, as in headless games
+    wtp.get_frame(scale_mode=wtp.UNSCALED)
+    results = {}
+    for name, setup, param, kind in BENCHMARKS:
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        if kind == 'memory' and not tracemalloc:
+            print('{:<36} skipped, needs tracemalloc'.format(name))
+            continue
+        with quiet():
+            func = setup(param)
+            if kind == 'memory':
+                result = measure_memory(func)
+            elif kind == 'sample':
+                result = measure_samples(func, repeat=repeat)
+            else:
+                result = measure(func, repeat=repeat)
+        results[name] = result
+        unit, scale, gain = units(result)
+        print('{:<36} {:>12.3f} {}'.format(name, result['best'] * scale,
+                                           unit))
+        if name == 'import_wtp' and result['best'] > IMPORT_TARGET:
+            print('{:<36} over its target of {:.3f} {}'.format(
+                '', IMPORT_TARGET * scale, unit))
+    return {'meta': {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                     'python': platform.python_version(),
+                     'pygame': pg.version.ver,
+                     'numpy': wtp.np.__version__ if wtp.np else None,
+                     'machine': platform.platform()},
+            'results': results}
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    '''
+    Prints each benchmark's change from baseline to current and returns
+    the names of those that got slower, or bigger, by more than threshold.
+    '''
+    regressions = []
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        try:
+            before = baseline['results'][name]['best']
+            after = current['results'][name]['best']
+        except KeyError:
+            print('{:<36} only in {}'.format(
+                name, 'baseline' if name in baseline['results'] else
+                'current run'))
+            continue
+        change = after / before - 1
+        unit, scale, gain = units(current['results'][name])
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = gain
+        else:
+            flag = ''
+        print('{:<36} {:>12.3f} {:>12.3f} {} {:>+8.1%} {}'.format(
+            name, before * scale, after * scale, unit, change, flag))
+    return regressions
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wild Tiger Petter '
+                                                 'benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('-o', '--output',
+                            help='JSON file to save the results to')
+    compare_parser = commands.add_parser(
+        'compare', help='compare results with a baseline')
+    compare_parser.add_argument('baseline', help='baseline JSON file')
+    compare_parser.add_argument('current', nargs='?',
+                                help='results JSON file; runs the '
+                                     'benchmarks if not given')
+    compare_parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                                help='slowdown counted as a regression, as '
+                                     'a fraction (default %(default)s)')
+    for command in (run_parser, compare_parser):
+        command.add_argument('-k', '--filter', default='*',
+                             help='only run benchmarks matching this glob')
+        command.add_argument('--repeat', type=int, default=REPEAT,
+                             help='timed repeats per benchmark')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = run(args.filter, args.repeat)
+        if args.output:
+            save(results, args.output)
+    elif args.command == 'compare':
+        baseline = load(args.baseline)
+        if args.current:
+            current = load(args.current)
+        else:
+            current = run(args.filter, args.repeat)
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
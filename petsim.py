@@ -0,0 +1,230 @@
+'''
+Batch petting simulation for tuning the petting parameters. Runs petting
+sessions through the game's own PetSession against synthetic mouse traces,
+spread over a process pool, and reports how often each combination of
+parameters ends in a PURR, YAWN or GRRR along with the purr scores.
+
+    python petsim.py --sessions 100000
+    python petsim.py --sweep too_fast_mod=1.2,1.4,1.6 --sweep yawn_max=500,1000
+    python petsim.py --sessions 1000000 --output sweep.json --histograms
+
+Each simulated player strokes back and forth at their own idea of the
+tiger's desired speed, off by a log-normal factor (--player-error), with
+every stroke varying around that by --stroke-jitter.
+'''
+from __future__ import print_function
+import os
+import json
+import random
+import argparse
+import itertools
+import collections
+import multiprocessing
+
+# no window and no sound; must be set before pygame initializes SDL
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import wtp
+
+PARAMETERS = collections.OrderedDict([
+    ('min_pet_speed', wtp.MIN_PET_SPEED),
+    ('max_pet_speed', wtp.MAX_PET_SPEED),
+    ('too_fast_mod', wtp.TOO_FAST_MOD),
+    ('too_slow_mod', wtp.TOO_SLOW_MOD),
+    ('yawn_max', wtp.YAWN_MAX),
+    ('grrr_max', wtp.GRRR_MAX),
+    ('petting_time', wtp.PETTING_TIME)])
+RESULTS = (wtp.PURR, wtp.YAWN, wtp.GRRR)
+
+BATCH_SIZE = 1000  # sessions per task handed to a worker
+SCORE_BIN = 250  # width of the purr score histogram bins
+MOUSE_RATE = 125  # mouse samples per second in the synthetic traces
+STROKE_LEFT, STROKE_RIGHT = 100, 700  # x range of the strokes, in pixels
+PLAYER_ERROR = 0.25  # sigma of the player's log-normal speed error
+STROKE_JITTER = 0.1  # relative standard deviation of each stroke's speed
+
+
+def stroke_trace(rng, speed, jitter, duration, rate=MOUSE_RATE):
+    '''
+    Yields (time, pos, pressed) samples of the mouse button held down and
+    stroking back and forth between STROKE_LEFT and STROKE_RIGHT at about
+    speed pixels per second, for duration seconds.
+    '''
+    x = float(STROKE_LEFT)
+    direction = 1
+    stroke_speed = max(rng.gauss(speed, speed * jitter), 0.0)
+    for i in range(1, int(duration * rate) + 1):
+        x += direction * stroke_speed / rate
+        if not STROKE_LEFT <= x <= STROKE_RIGHT:
+            x = min(max(x, STROKE_LEFT), STROKE_RIGHT)
+            direction = -direction
+            stroke_speed = max(rng.gauss(speed, speed * jitter), 0.0)
+        yield (float(i) / rate, (int(x), wtp.CENTER_FRAME_Y), True)
+
+
+def run_batch(task):
+    '''
+    Simulates a batch of sessions with one set of parameters. Returns the
+    parameters, the count of each result and the purr score histogram.
+    '''
+    params, sessions, seed, player_error, stroke_jitter = task
+    rng = random.Random(seed)
+    results = collections.Counter()
+    histogram = collections.Counter()
+    total_score = 0.0
+    for i in range(sessions):
+        desired = rng.randrange(int(params['min_pet_speed']),
+                                int(params['max_pet_speed']))
+        session = wtp.PetSession(desired,
+                                 desired * params['too_fast_mod'],
+                                 desired * params['too_slow_mod'],
+                                 yawn_max=params['yawn_max'],
+                                 grrr_max=params['grrr_max'],
+                                 petting_time=params['petting_time'])
+        speed = desired * rng.lognormvariate(0, player_error)
+        trace = stroke_trace(rng, speed, stroke_jitter,
+                             params['petting_time'] + 1)
+        result, score = wtp.simulate_petting(session, trace)
+        results[result] += 1
+        histogram[int(score // SCORE_BIN) * SCORE_BIN] += 1
+        total_score += score
+    return params, results, histogram, total_score
+
+
+def sweep(overrides):
+    '''
+    Returns every combination of parameters, taking the listed values of
+    the swept parameters and the game's own value of the rest.
+    '''
+    names = list(PARAMETERS)
+    values = [overrides.get(name, [PARAMETERS[name]]) for name in names]
+    return [collections.OrderedDict(zip(names, combination))
+            for combination in itertools.product(*values)]
+
+
+def simulate(combinations, sessions, workers=None, seed=0,
+             player_error=PLAYER_ERROR, stroke_jitter=STROKE_JITTER):
+    '''
+    Runs sessions sessions for each combination of parameters over a pool
+    of workers, one per core by default, and aggregates their results. The
+    batches are seeded by their position, so the totals don't depend on the
+    number of workers.
+    '''
+    tasks = []
+    for combination in combinations:
+        for start in range(0, sessions, BATCH_SIZE):
+            tasks.append((combination, min(BATCH_SIZE, sessions - start),
+                          seed * 1000003 + len(tasks), player_error,
+                          stroke_jitter))
+    workers = workers or multiprocessing.cpu_count()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        batches = pool.imap_unordered(run_batch, tasks)
+    else:
+        pool = None
+        batches = (run_batch(task) for task in tasks)
+
+    totals = collections.OrderedDict(
+        (tuple(combination.items()),
+         {'params': combination, 'sessions': 0,
+          'results': collections.Counter(),
+          'histogram': collections.Counter(), 'total_score': 0.0})
+        for combination in combinations)
+    try:
+        for params, results, histogram, total_score in batches:
+            total = totals[tuple(params.items())]
+            total['sessions'] += sum(results.values())
+            total['results'].update(results)
+            total['histogram'].update(histogram)
+            total['total_score'] += total_score
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return list(totals.values())
+
+
+def print_report(totals, histograms=False):
+    swept = [name for name in PARAMETERS
+             if len(set(total['params'][name] for total in totals)) > 1]
+    print('{}{:>10}{:>8}{:>8}{:>8}{:>12}'.format(
+        ''.join('{:>14}'.format(name) for name in swept),
+        'sessions', 'purr', 'yawn', 'grrr', 'mean score'))
+    for total in totals:
+        sessions = float(total['sessions'])
+        print('{}{:>10}{}{:>12.1f}'.format(
+            ''.join('{:>14}'.format(total['params'][name]) for name in swept),
+            total['sessions'],
+            ''.join('{:>8.1%}'.format(total['results'][result] / sessions)
+                    for result in RESULTS),
+            total['total_score'] / sessions))
+        if histograms:
+            most = max(total['histogram'].values())
+            for score in sorted(total['histogram']):
+                count = total['histogram'][score]
+                print('    {:>7}-{:<7} {:>9} {}'.format(
+                    score, score + SCORE_BIN - 1, count,
+                    '#' * int(round(40.0 * count / most))))
+
+
+def parse_sweep(specs):
+    overrides = {}
+    for spec in specs:
+        try:
+            name, values = spec.split('=')
+        except ValueError:
+            raise SystemExit('--sweep takes NAME=VALUE,VALUE,...')
+        if name not in PARAMETERS:
+            raise SystemExit('Unknown parameter {}; choose from {}'.format(
+                name, ', '.join(PARAMETERS)))
+        overrides[name] = [float(value) for value in values.split(',')]
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wild Tiger Petter batch '
+                                                 'petting simulation')
+    parser.add_argument('--sessions', type=int, default=10000,
+                        help='sessions per combination of parameters')
+    parser.add_argument('--sweep', action='append', default=[],
+                        metavar='NAME=VALUE,...',
+                        help='values of a parameter to sweep; one of '
+                             '{}'.format(', '.join(PARAMETERS)))
+    parser.add_argument('--workers', type=int,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--player-error', type=float, default=PLAYER_ERROR)
+    parser.add_argument('--stroke-jitter', type=float, default=STROKE_JITTER)
+    parser.add_argument('--histograms', action='store_true',
+                        help='print the purr score histograms')
+    parser.add_argument('--output', help='JSON file to save the results to')
+    args = parser.parse_args()
+    if args.sessions < 1:
+        parser.error('--sessions must be at least 1')
+    combinations = sweep(parse_sweep(args.sweep))
+    for combination in combinations:
+        # desired speeds are drawn from range(min_pet_speed, max_pet_speed)
+        if (int(combination['min_pet_speed']) >=
+                int(combination['max_pet_speed'])):
+            parser.error('min_pet_speed must be below max_pet_speed, but '
+                         'they are {} and {}'.format(
+                             combination['min_pet_speed'],
+                             combination['max_pet_speed']))
+
+    totals = simulate(combinations, args.sessions, args.workers, args.seed,
+                      args.player_error, args.stroke_jitter)
+    print_report(totals, args.histograms)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([{'params': total['params'],
+                        'sessions': total['sessions'],
+                        'results': dict(total['results']),
+                        'histogram': sorted(total['histogram'].items()),
+                        'mean_score': total['total_score'] /
+                        total['sessions']}
+                       for total in totals], f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
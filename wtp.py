@@ -3,26 +3,83 @@ import sys
 import math
 import pygame as pg
 import random
-pg.init()
+import json
+import mmap
+import struct
+import io
+import gzip
+import heapq
+import threading
+import collections
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import timeit
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 #########################
 # GLOBAL CONSTANTS
 
-FPS = 30  # frames per second setting
-
-# FRAME_WIDTH, FRAME_HEIGHT = 1280, 720
-FRAME_WIDTH, FRAME_HEIGHT = 800, 600
+FPS = 60  # most frames rendered per second; 0 renders as many as possible
+TICK_RATE = 30  # simulation ticks per second, whatever the frame rate
+TICK = 1.0 / TICK_RATE  # seconds of game time simulated by each tick
+DIRTY_RECT_RENDERING = True  # only redraw and update regions that changed
+DIRTY_RECT_MAX_AREA = 0.5  # fraction of the frame above which to redraw all
+# window events after which the frame is redrawn whole, as the window's
+# contents may have been lost
+REDRAW_EVENTS = (pg.VIDEOEXPOSE, pg.WINDOWEXPOSED, pg.WINDOWSHOWN,
+                 pg.WINDOWRESTORED)
+PROFILE_WINDOW = 120  # frames the profiler's rolling statistics cover
+PROFILE_HUD_RATE = 15  # frames between refreshes of the profiler HUD
+PROFILE_FONT = 'couriernew'
+PROFILE_FONT_HEIGHT = 14
+
+
+def parse_size(text):
+    '''
+    Parses a WIDTHxHEIGHT size, e.g. 1280x720.
+    '''
+    size = tuple(int(n) for n in text.lower().split('x'))
+    if len(size) != 2 or min(size) <= 0:
+        raise ValueError('Size must be WIDTHxHEIGHT')
+    return size
+
+
+# the resolution the game renders at, whatever the size of the window; set
+# WTP_RENDER_SIZE, e.g. to 1280x720, to change it
+RENDER_SIZE_VAR = 'WTP_RENDER_SIZE'
+try:
+    FRAME_WIDTH, FRAME_HEIGHT = parse_size(
+        os.environ.get(RENDER_SIZE_VAR, '800x600'))
+except ValueError:
+    raise SystemExit('{} must be WIDTHxHEIGHT, e.g. 1280x720, not {!r}'.format(
+        RENDER_SIZE_VAR, os.environ[RENDER_SIZE_VAR]))
 SCREEN_RECT = pg.Rect(0, 0, FRAME_WIDTH, FRAME_HEIGHT)
 CENTER_FRAME_X = FRAME_WIDTH / 2
 CENTER_FRAME_Y = FRAME_HEIGHT / 2
 CENTER_FRAME_POS = (CENTER_FRAME_X, CENTER_FRAME_Y)
-FRAME = pg.display.set_mode((FRAME_WIDTH, FRAME_HEIGHT))  # , pg.FULLSCREEN)
+FRAME = None  # the surface the game renders to, once get_frame() made it
+FULLSCREEN = False  # full screen at the desktop size, the frame scaled to it
+UNSCALED = 'none'  # a window the size of the frame
+# SDL scales the frame to the window, repeating pixels: a whole number of
+# times in a window, but not in full screen, where it fills the screen's
+# height or width and some pixels come out wider or taller than others
+SHARP = 'sharp'
+SMOOTH = 'smooth'  # SDL scales the frame to the window, filtered
+SCALE_MODES = (UNSCALED, SHARP, SMOOTH)
+SCALE_MODE = SHARP  # how frames are scaled when the window is bigger
+SCALE_QUALITY = {SHARP: 'nearest', SMOOTH: 'linear'}  # SDL's names for them
 
 OFFSCREEN = (-2000, -2000)
 TOPLEFT = 'topleft'
 CENTER = 'center'
 
 DEFAULT_FONT = 'arial'
+TEXT_CACHE_SIZE = 256  # rendered strings kept by TEXT_CACHE
 
 BLACK  = (  0,   0,   0)
 WHITE  = (255, 255, 255)
@@ -35,8 +92,7 @@ YELLOW = (255, 255,   0)
 #########################
 #   GameState Constants
 
-MOVE_SPEED = 1
-DEFAULT_TILE_MATRIX_SIZE = 5
+MOVE_SPEED = 30  # pixels per second
 DEFAULT_NUM_TIGERS = 10
 
 # Modes
@@ -56,15 +112,17 @@ A = pg.K_a
 S = pg.K_s
 D = pg.K_d
 H = pg.K_h
-
-DIRECTIONS = {LEFT: (-MOVE_SPEED, 0),
-              UP: (0, -MOVE_SPEED),
-              RIGHT: (MOVE_SPEED, 0),
-              DOWN: (0, MOVE_SPEED),
-              A: (-MOVE_SPEED, 0),
-              W: (0, -MOVE_SPEED),
-              D: (MOVE_SPEED, 0),
-              S: (0, MOVE_SPEED)}
+PROFILE_KEY = pg.K_F3
+ESCAPE = pg.K_ESCAPE
+
+DIRECTIONS = {LEFT: (-1, 0),
+              UP: (0, -1),
+              RIGHT: (1, 0),
+              DOWN: (0, 1),
+              A: (-1, 0),
+              W: (0, -1),
+              D: (1, 0),
+              S: (0, 1)}
 
 DEGREES = (0.0, 90.0, 180.0, 270.0)
 
@@ -73,7 +131,7 @@ DI_DE = {DIRECTIONS[LEFT]: 0.0,
          DIRECTIONS[RIGHT]: 180.0,
          DIRECTIONS[DOWN]: 90.0}
 
-PLAYER_ANIM_RATE = 8
+PLAYER_ANIM_TIME = 0.3  # seconds each walking frame is shown
 
 TILES_PATH = './tiles'
 SPRITES_PATH = './sprites'
@@ -81,27 +139,46 @@ TIGER_PICS_PATH = './tiger_pics'
 TIGER_SPRITES_FILENAME = 'tiger_sprites.png'
 PLAYER_SPRITES_FILENAME = 'walker2.png'
 TILE_SIZE = 200
+# tiles along each side of the matrix, enough to cover the frame wherever
+# the player stands on the center tile, and never fewer than 5
+DEFAULT_TILE_MATRIX_SIZE = max(5, 2 * int(math.ceil(
+    max(FRAME_WIDTH, FRAME_HEIGHT) / 2.0 / TILE_SIZE)) + 1)
+TILE_BUCKET_SIZE = 50  # side of the spatial index cells tigers are kept in
+CHUNK_SIZE = 8  # tiles along each side of a world chunk
+CHUNK_CACHE_SIZE = 64  # least recently used world chunks kept in memory
+WORLD_SEED = None  # seed the world is generated from; None for a new world
+ASSET_BUNDLE_PATH = './assets.bundle'
+ASSET_BUNDLE_VERSION = 1
+BUNDLE_FORMATS = ('BGRA', 'RGBX', 'ARGB')  # pixel formats bundles can use
 
 TIGER_W, TIGER_H = 19, 51
 PLAYER_H, PLAYER_W = 20, 20
 
 SCORE_COUNTER_POS = (5, 5)
 PETTED_COUNTER_POS = (5, 30)
+PROFILE_HUD_POS = (5, 60)
+LOADING_TEXT_POS = (5, FRAME_HEIGHT - 25)
 
 ######################################
 # Tiger Petting constants
 
 MAX_PICTURE_HEIGHT = int(FRAME_HEIGHT * 0.75)
+PICTURE_CACHE_BUDGET = 32 * 1024 * 1024  # bytes of decoded pictures to keep
+PICTURE_PREFETCH_COUNT = 3  # nearest tigers whose pictures are kept ready
+PICTURE_PREFETCH_RATE = 0.5  # seconds between prefetch checks
 
-MIN_PET_SPEED, MAX_PET_SPEED = 5, 10
+MIN_PET_SPEED, MAX_PET_SPEED = 150, 300  # pixels per second
 TOO_FAST_MOD, TOO_SLOW_MOD = 1.4, 0.8
-PETTING_TIME = FPS * 20
-PET_BAR_MOD = 60
+PETTING_TIME = 20.0  # seconds
+PET_BAR_MOD = 2.0  # pet bar pixels per pixel per second of petting
 PET_BAR_HEIGHT = 50
 PET_BAR_CENTER = (CENTER_FRAME_X, 20)
 PET_TEXT_CENTER = (CENTER_FRAME_X, 60)
 PET_TEXT_HEIGHT = 30
-NUM_PETS = 100
+NUM_PETS = 100  # time slots in the pet speed ring buffer
+PET_SPEED_WINDOW = 10 / 3.0  # seconds of petting averaged into the speed
+PET_SPEED_TOLERANCE = 1.0  # pixels per second; caps the purr rate
+PURR_RATE = 900.0  # purr score per second when 1 pixel per second off
 
 YAWN = 'YAAAWWWNNN...'
 PURR = 'PUUURRRRRRRRR'
@@ -109,17 +186,20 @@ GRRR = 'GRRRRRRRRRRR!'
 
 YAWN_MAX = 1000
 GRRR_MAX = 500
+PET_REACTION_COLORS = {PURR: ORANGE, YAWN: YELLOW, GRRR: RED}
 
-ROAR_MIN = FPS * 6
-ROAR_MAX = FPS * 12
+ROAR_MIN = 6.0  # seconds
+ROAR_MAX = 12.0
 ROAR_HEIGHT_FAR = 20
 ROAR_HEIGHT_NEAR = 30
 ROAR_DISTANCE = TILE_SIZE * 3
+ROAR_EDGE_OFFSET = 30  # distance from the screen edge of offscreen roars
+TIGER_ARRAYS = True  # keep per frame tiger state in NumPy arrays if available
 
 ##############################################
 # Message Screens constants
 
-MESSAGE_SCREEN_COOLDOWN = int(FPS * 0.8)
+MESSAGE_SCREEN_COOLDOWN = 0.8  # seconds before space is accepted
 MESSAGE_FONT_HEIGHT = 25
 MESSAGE_LINE_SPACING = 20
 
@@ -158,6 +238,7 @@ GAME_OVER_MESSAGES = [
     'Congratulations, you petted all the tigers!',
     'Press Space to start a new game, or Esc to quit.'
 ]
+LOADING_MESSAGE = 'Looking for tigers... {} / {}'
 CONTINUE_MESSAGES = [
     'Press "H" at any time for help. Press "Space" to continue.'
 ]
@@ -171,6 +252,66 @@ PET_FEEDBACK = {
 #############################
 
 
+################################################
+# Startup
+
+
+def init(headless=False):
+    '''
+    Initializes the pygame subsystems the game uses, the display and fonts.
+    pg.init would also start audio and joysticks, which the game has no use
+    for. Headless runs use SDL's dummy drivers, so no window opens; this
+    only takes effect before the display is first initialized.
+    '''
+    if headless:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    if not pg.display.get_init():
+        pg.display.init()
+    if not pg.font.get_init():
+        pg.font.init()
+
+
+def get_frame(fullscreen=FULLSCREEN, scale_mode=SCALE_MODE):
+    '''
+    Returns the surface the game renders to, opening the window the first
+    time it's asked for; the window options only apply then. The frame is
+    always FRAME_WIDTH by FRAME_HEIGHT. Unless scale_mode is UNSCALED, SDL
+    scales it to the window as it's presented: the largest window the
+    desktop fits a whole number of frames in, or the whole screen when
+    fullscreen. Only the window is scaled by a whole number; full screen
+    fills as much of the screen as the frame's aspect ratio allows, so
+    SHARP pixels come out unevenly sized there, e.g. 800x600 at 1.8 times
+    on a 1080p screen. SDL maps mouse positions back into the frame too.
+    Images are converted to the frame's pixel format, so loading them
+    opens the window too.
+    '''
+    global FRAME
+    if FRAME is None:
+        if scale_mode not in SCALE_MODES:
+            raise ValueError('Scale mode must be one of {}'.format(
+                ', '.join(SCALE_MODES)))
+        init()
+        flags = pg.FULLSCREEN if fullscreen else 0
+        if scale_mode != UNSCALED or fullscreen:
+            os.environ['SDL_RENDER_SCALE_QUALITY'] = SCALE_QUALITY.get(
+                scale_mode, SCALE_QUALITY[SHARP])
+            flags |= pg.SCALED
+        FRAME = pg.display.set_mode((FRAME_WIDTH, FRAME_HEIGHT), flags)
+    return FRAME
+
+
+def present(rects=None):
+    '''
+    Shows the frame in the window: only the rects of it given, or else all
+    of it.
+    '''
+    if rects is None:
+        pg.display.update()
+    else:
+        pg.display.update(rects)
+
+
 ################################################
 # Image loading tools
 
@@ -180,42 +321,474 @@ def get_file_paths(root):
 
 
 def load_image(filename):
-    return pg.image.load(filename).convert()
+    image = ASSETS.get(image_key(filename))
+    if image is None:
+        image = pg.image.load(filename).convert(get_frame())
+    return image
 
 
-def load_rand_tile():
-    filename = random.choice(get_file_paths(TILES_PATH))
-    return load_image(filename)
+def image_key(filename):
+    return 'image:' + os.path.normpath(filename)
+
+
+def picture_key(filename):
+    return 'picture:' + os.path.normpath(filename)
+
+
+TIGER_SPRITE_KEY = 'tiger_sprite'
+PLAYER_FRAMES_KEY = 'player_frames'
+
+
+def bundle_view(data, offset, length):
+    try:
+        return memoryview(data)[offset:offset + length]
+    except TypeError:
+        # Python 2 mmap only supports the old buffer protocol
+        return buffer(data, offset, length)
+
+
+def bundle_format():
+    '''
+    Returns the pixel format, as named by pg.image.tostring, that lays out
+    pixels the way the display does, so that bundled Surfaces can be drawn
+    straight from the mapped file. Falls back on RGBX, which is converted
+    when loaded, if this pygame has no such format.
+    '''
+    display = get_frame()
+    if display.get_bitsize() == 32:
+        for pixel_format in BUNDLE_FORMATS:
+            try:
+                surface = pg.image.frombuffer(b'\0' * 4, (1, 1),
+                                              pixel_format)
+            except ValueError:
+                continue
+            if surface.get_masks()[:3] == display.get_masks()[:3]:
+                return pixel_format
+    return 'RGBX'
+
+
+def bundle_recipes():
+    '''
+    Yields (name, surface) for everything stored in the asset bundle: every
+    tile and sprite image, every tiger picture already scaled, and the
+    tiger and player frames already sliced out of their sprite sheets.
+    '''
+    for filename in get_file_paths(TILES_PATH) + get_file_paths(SPRITES_PATH):
+        yield image_key(filename), pg.image.load(filename)
+    for filename in get_file_paths(TIGER_PICS_PATH):
+        yield picture_key(filename), scale_picture(pg.image.load(filename))
+    sheet = pg.image.load(os.path.join(SPRITES_PATH, TIGER_SPRITES_FILENAME))
+    yield TIGER_SPRITE_KEY, slice_tiger_sprite(sheet)
+    sheet = pg.image.load(os.path.join(SPRITES_PATH, PLAYER_SPRITES_FILENAME))
+    for i, frame in enumerate(slice_player_frames(sheet)):
+        yield '{}/{}'.format(PLAYER_FRAMES_KEY, i), frame
+
+
+class AssetBundle(object):
+    '''
+    A single packed file of preprocessed 32 bit pixel data, laid out like
+    the display's pixels, with a JSON index, built from the tiles, sprites
+    and tiger pictures directories. At runtime the file is memory mapped
+    and Surfaces are made directly on top of the mapped buffers. The
+    bundle is rebuilt whenever a source file is added, removed, or changes
+    mtime or size.
+    '''
+    MAGIC = b'WTPASSET'
+    HEADER = struct.Struct('<8sI')
+    ALIGN = 16
+
+    def __init__(self, path, roots):
+        self.path = path
+        self.roots = roots
+        self.file = None
+        self.data = None
+        self.index = None
+        self.data_start = 0
+        self.surfaces = {}
+        self.failed = False
+        self.pixel_format = None
+
+    def __str__(self):
+        return 'AssetBundle {}: {} entries'.format(
+            self.path, len(self.index['entries']) if self.index else 0)
+
+    def params(self):
+        if self.pixel_format is None:
+            self.pixel_format = bundle_format()
+        return {'version': ASSET_BUNDLE_VERSION,
+                'pixel_format': self.pixel_format,
+                'display_masks': list(get_frame().get_masks()),
+                'max_picture_height': MAX_PICTURE_HEIGHT,
+                'tiger_size': [TIGER_W, TIGER_H],
+                'player_size': [PLAYER_W, PLAYER_H]}
+
+    def sources(self):
+        sources = {}
+        for root in self.roots:
+            for filename in get_file_paths(root):
+                stat = os.stat(filename)
+                sources[os.path.normpath(filename)] = [stat.st_mtime,
+                                                       stat.st_size]
+        return sources
+
+    def read_index(self):
+        try:
+            with open(self.path, 'rb') as f:
+                magic, length = self.HEADER.unpack(f.read(self.HEADER.size))
+                if magic != self.MAGIC:
+                    return None
+                return json.loads(f.read(length).decode('utf-8'))
+        except (IOError, OSError, ValueError, struct.error):
+            return None
+
+    def is_stale(self, index=None):
+        index = index or self.read_index()
+        return (not index or index['params'] != self.params() or
+                index['sources'] != self.sources())
+
+    def build(self):
+        '''
+        Decodes, scales and slices every asset from disk and writes the
+        bundle file. This is the asset build step; it also runs on its own
+        the first time a stale bundle is used.
+        '''
+        print('Building asset bundle {}'.format(self.path))
+        self.close()
+        entries = {}
+        chunks = []
+        offset = 0
+        self.params()
+        for name, surface in bundle_recipes():
+            data = pg.image.tostring(surface, self.pixel_format)
+            w, h = surface.get_size()
+            entries[name] = [offset, w, h]
+            padding = -len(data) % self.ALIGN
+            chunks.append(data + b'\0' * padding)
+            offset += len(data) + padding
+        index = json.dumps({'params': self.params(),
+                            'sources': self.sources(),
+                            'entries': entries}).encode('utf-8')
+        header = self.HEADER.pack(self.MAGIC, len(index)) + index
+        header += b'\0' * (-len(header) % self.ALIGN)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            for chunk in chunks:
+                f.write(chunk)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+
+    def open(self):
+        index = self.read_index()
+        if self.is_stale(index):
+            self.build()
+            index = self.read_index()
+        self.file = open(self.path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = index
+        index_length = self.HEADER.unpack(self.data[:self.HEADER.size])[1]
+        self.data_start = self.HEADER.size + index_length
+        self.data_start += -self.data_start % self.ALIGN
+
+    def close(self):
+        self.surfaces = {}
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+        self.file = self.data = self.index = None
+
+    def available(self):
+        if self.index is None and not self.failed:
+            try:
+                self.open()
+            except (IOError, OSError) as e:
+                print('Asset bundle unavailable, loading from disk: '
+                      '{}'.format(e))
+                self.close()
+                self.failed = True
+        return self.index is not None
+
+    def get(self, name, cache=True):
+        '''
+        Returns the Surface stored under name, or None if it isn't bundled.
+        The Surface shares memory with the mapped file unless this pygame
+        can't lay pixels out like the display, in which case it is converted
+        once. Bundled pixels are opaque, so any alpha channel is ignored.
+        Pass cache=False for Surfaces whose lifetime is managed elsewhere.
+        '''
+        try:
+            return self.surfaces[name]
+        except KeyError:
+            pass
+        if not self.available() or name not in self.index['entries']:
+            return None
+        offset, w, h = self.index['entries'][name]
+        view = bundle_view(self.data, self.data_start + offset, w * h * 4)
+        surface = pg.image.frombuffer(view, (w, h), self.pixel_format)
+        display = get_frame()
+        if surface.get_masks()[:3] != display.get_masks()[:3]:
+            surface = surface.convert(display)
+        elif surface.get_alpha() is not None:
+            surface.set_alpha(None)
+        if cache:
+            self.surfaces[name] = surface
+        return surface
+
+    def sequence(self, name):
+        frames = []
+        while True:
+            frame = self.get('{}/{}'.format(name, len(frames)))
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+
+ASSETS = AssetBundle(ASSET_BUNDLE_PATH,
+                     (TILES_PATH, SPRITES_PATH, TIGER_PICS_PATH))
+
+
+class TileCache(object):
+    '''
+    Indexes the tiles directory once and keeps every tile decoded in memory,
+    along with all of its DEGREES rotations, so that showing a tile costs
+    a dictionary lookup instead of a directory walk and a JPEG decode.
+    Hits and misses are counted; a miss means a tile was read from disk.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.paths = None
+        self.rotations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return 'TileCache {}: {} tiles, {} hits, {} misses'.format(
+            self.root, len(self.rotations), self.hits, self.misses)
+
+    def index(self):
+        if self.paths is None:
+            self.paths = sorted(get_file_paths(self.root))
+        return self.paths
+
+    def get(self, filename, degrees=0.0):
+        try:
+            rotations = self.rotations[filename]
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            image = load_image(filename)
+            rotations = {de: pg.transform.rotate(image, de) for de in DEGREES}
+            self.rotations[filename] = rotations
+        return rotations[degrees]
+
+    def preload(self):
+        for filename in self.index():
+            if filename not in self.rotations:
+                self.get(filename)
+
+    def stats(self):
+        return {'tiles': len(self.rotations),
+                'hits': self.hits,
+                'misses': self.misses}
+
+
+TILE_CACHE = TileCache(TILES_PATH)
+
+
+def slice_tiger_sprite(sheet):
+    return sheet.subsurface((0, 0, TIGER_W, TIGER_H))
+
+
+def slice_player_frames(sheet):
+    return [sheet.subsurface(x, 0, PLAYER_H, PLAYER_W)
+            for x in range(0, sheet.get_width(), PLAYER_W)]
 
 
-# should convert this into a general sprite getting function
 def load_tiger_sprite():
-    filename = os.path.join(SPRITES_PATH, TIGER_SPRITES_FILENAME)
-    image = load_image(filename)
+    image = ASSETS.get(TIGER_SPRITE_KEY)
+    if image is None:
+        image = slice_tiger_sprite(
+            load_image(os.path.join(SPRITES_PATH, TIGER_SPRITES_FILENAME)))
     image.set_colorkey(WHITE)
-    return image.subsurface((0, 0, TIGER_W, TIGER_H))
+    return image
 
 
-def load_tiger_pics(num_tigers):
+def tiger_pic_paths(num_tigers):
+    '''
+    Picks a picture file for each tiger, reusing pictures when there are
+    more tigers than pictures.
+    '''
     paths = get_file_paths(TIGER_PICS_PATH)
     random.shuffle(paths)
-    return [scale_picture(load_image(filename))
-            for filename in paths[:num_tigers]]
+    return [paths[i % len(paths)] for i in range(num_tigers)]
 
 
-def scale_picture(picture):
-    w, h = picture.get_size()
+class PictureCache(object):
+    '''
+    Keeps tiger pictures in compressed form and decodes them on demand into
+    a least recently used cache of Surfaces whose total size is capped at
+    budget bytes. Pictures can be prefetched on a background thread so the
+    picture of the next tiger to be petted is already decoded; asking for
+    a picture the thread is still decoding waits for it to finish.
+    '''
+    def __init__(self, budget=PICTURE_CACHE_BUDGET):
+        self.budget = budget
+        self.compressed = {}
+        self.surfaces = collections.OrderedDict()
+        self.resident = 0
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.decoded = threading.Condition(self.lock)
+        self.requests = queue.Queue()
+        self.worker = None
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return ('PictureCache: {} pictures, {} / {} bytes, '
+                '{} hits, {} misses').format(len(self.surfaces), self.resident,
+                                             self.budget, self.hits,
+                                             self.misses)
+
+    def store(self, filenames, progress=None):
+        '''
+        Reads the compressed picture files into memory. Not needed when the
+        asset bundle is available, as pictures are then decoded from it.
+        '''
+        filenames = sorted(set(filenames))
+        bundled = ASSETS.available()
+        for i, filename in enumerate(filenames):
+            if not bundled and filename not in self.compressed:
+                with open(filename, 'rb') as f:
+                    self.compressed[filename] = f.read()
+            if progress:
+                progress(i + 1, len(filenames))
+
+    def decode(self, filename):
+        picture = ASSETS.get(picture_key(filename), cache=False)
+        if picture is None:
+            try:
+                source = io.BytesIO(self.compressed[filename])
+            except KeyError:
+                source = filename
+            picture = scale_picture(pg.image.load(source, filename))
+            picture = picture.convert(get_frame())
+        return picture
+
+    def insert(self, filename, picture):
+        with self.lock:
+            if filename in self.surfaces:
+                return
+            self.surfaces[filename] = picture
+            self.resident += picture.get_pitch() * picture.get_height()
+            while self.resident > self.budget and len(self.surfaces) > 1:
+                old_filename, old = self.surfaces.popitem(last=False)
+                self.resident -= old.get_pitch() * old.get_height()
+
+    def get(self, filename):
+        with self.lock:
+            while filename in self.pending:
+                self.decoded.wait()
+            picture = self.surfaces.pop(filename, None)
+            if picture is not None:
+                self.surfaces[filename] = picture
+                self.hits += 1
+                return picture
+            self.misses += 1
+        picture = self.decode(filename)
+        self.insert(filename, picture)
+        return picture
+
+    def prefetch(self, filenames):
+        for filename in filenames:
+            with self.lock:
+                if filename in self.surfaces or filename in self.pending:
+                    continue
+                self.pending.add(filename)
+            self.requests.put(filename)
+        if self.worker is None and self.pending:
+            self.worker = threading.Thread(target=self.run_prefetch)
+            self.worker.daemon = True
+            self.worker.start()
+
+    def run_prefetch(self):
+        while True:
+            filename = self.requests.get()
+            try:
+                with self.lock:
+                    resident = filename in self.surfaces
+                if not resident:
+                    self.insert(filename, self.decode(filename))
+            except Exception as e:
+                # get() decodes it again on the main thread, and reports
+                # the error if it happens again
+                print('Prefetching {} failed: {}'.format(filename, e))
+            finally:
+                with self.lock:
+                    self.pending.discard(filename)
+                    self.decoded.notify_all()
+
+
+def scale_size(size):
+    w, h = size
     h_ratio = float(h) / MAX_PICTURE_HEIGHT
-    new_size = (int(float(w) / h_ratio), int(float(h) / h_ratio))
-    return pg.transform.smoothscale(picture, new_size)
+    return (int(float(w) / h_ratio), int(float(h) / h_ratio))
+
+
+def scale_picture(picture):
+    return pg.transform.smoothscale(picture, scale_size(picture.get_size()))
 
 
 def get_player_frames():
-    filename = os.path.join(SPRITES_PATH, PLAYER_SPRITES_FILENAME)
-    image = load_image(filename)
-    image.set_colorkey(WHITE)
-    return [image.subsurface(x, 0, PLAYER_H, PLAYER_W)
-            for x in range(0, image.get_width(), PLAYER_W)]
+    frames = ASSETS.sequence(PLAYER_FRAMES_KEY)
+    if not frames:
+        frames = slice_player_frames(
+            load_image(os.path.join(SPRITES_PATH, PLAYER_SPRITES_FILENAME)))
+    for frame in frames:
+        frame.set_colorkey(WHITE)
+    return frames
+
+
+class SpriteAtlas(object):
+    '''
+    Loads each sprite sheet once and keeps all of its frames sliced,
+    rotated to every one of DEGREES, converted to the display format and
+    colorkeyed with RLE acceleration. Every Tiger and Player shares these
+    frames, so creating one needs no file I/O and no image transforms.
+    '''
+    loaders = {TIGER_SPRITE_KEY: lambda: [load_tiger_sprite()],
+               PLAYER_FRAMES_KEY: get_player_frames}
+
+    def __init__(self):
+        self.frames = {}
+
+    def __str__(self):
+        return 'SpriteAtlas: {}'.format(
+            ', '.join('{} {}'.format(name, de)
+                      for name, de in sorted(self.frames)))
+
+    def load(self, name):
+        for de in DEGREES:
+            frames = []
+            for frame in self.loaders[name]():
+                frame = pg.transform.rotate(frame, de).convert(get_frame())
+                frame.set_colorkey(WHITE, pg.RLEACCEL)
+                frames.append(frame)
+            self.frames[(name, de)] = frames
+
+    def get(self, name, degrees=0.0):
+        try:
+            return self.frames[(name, degrees)]
+        except KeyError:
+            self.load(name)
+            return self.frames[(name, degrees)]
+
+    def first(self, name, degrees=0.0):
+        return self.get(name, degrees)[0]
+
+
+SPRITE_ATLAS = SpriteAtlas()
 
 
 ##########################################
@@ -223,7 +796,7 @@ def get_player_frames():
 
 
 def init_matrix_pos(matrix_size):
-    return tuple([xy - (TILE_SIZE * (matrix_size / 2)) - TILE_SIZE / 2
+    return tuple([xy - (TILE_SIZE * (matrix_size // 2)) - TILE_SIZE // 2
                   for xy in CENTER_FRAME_POS])
 
 
@@ -249,13 +822,27 @@ def mirror_direction(direction):
     return tuple(-xy for xy in direction)
 
 
+def attribute_names(obj):
+    '''
+    Returns the names of the attributes set on obj, whether they live in
+    its __dict__ or in the __slots__ of its classes.
+    '''
+    names = list(getattr(obj, '__dict__', ()))
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, name):
+                names.append(name)
+    return names
+
+
 def cleanup(obj):
     '''
     Deletes all game objects and their attributes when ending a game and
     starting a new game.
     '''
     if obj:
-        for name, attr in obj.__dict__.items():
+        for name in attribute_names(obj):
+            attr = getattr(obj, name)
             try:
                 attr.cleanup()
             except AttributeError:
@@ -275,21 +862,25 @@ def cleanup(obj):
 #######################################################
 
 
-class ImgObj(pg.sprite.Sprite):
+class ImgObj(object):
     '''
     This is the parent class for game objects which are rectangular, can
-    move around in the world, and have other useful properties.
+    move around in the world, and have other useful properties. The rect is
+    the only copy of an object's geometry: its position is the point of the
+    rect named by alignment, and its size is the rect's size. Game objects
+    are numerous, so they keep their attributes in __slots__.
     '''
+    __slots__ = ('alignment', 'image', '_rect')
+
     def __init__(self, pos=OFFSCREEN, image=None,
                  width=0, height=0, alignment=TOPLEFT):
-        pg.sprite.Sprite.__init__(self)
         self.alignment = alignment
         if image:
             self.image = image
-            self.rect = self.image.get_rect()
+            self._rect = self.image.get_rect()
         else:
             self.image = pg.Surface((width, height))
-            self.rect = pg.Rect(pos, (width, height))
+            self._rect = pg.Rect(pos, (width, height))
         self.pos = pos
 
     def __str__(self):
@@ -300,22 +891,21 @@ class ImgObj(pg.sprite.Sprite):
 
     @property
     def pos(self):
-        return self._x, self._y
+        return getattr(self._rect, self.alignment)
 
     @pos.setter
     def pos(self, pos):
         if not isinstance(pos, tuple) and len(pos) == 2:
             raise TypeError('{} pos must be tuple len 2.'.format(repr(self)))
-        self._x, self._y = pos
-        setattr(self.rect, self.alignment, pos)
+        setattr(self._rect, self.alignment, pos)
 
     @property
     def x(self):
-        return self._x
+        return self.pos[0]
 
     @property
     def y(self):
-        return self._y
+        return self.pos[1]
 
     @property
     def rect(self):
@@ -324,10 +914,6 @@ class ImgObj(pg.sprite.Sprite):
     @rect.setter
     def rect(self, rect):
         self._rect = rect
-        self._width = rect.width
-        self._height = rect.height
-        self._center = rect.center
-        self.pos = getattr(rect, self.alignment)
 
     @property
     def width(self):
@@ -335,7 +921,6 @@ class ImgObj(pg.sprite.Sprite):
 
     @width.setter
     def width(self, w):
-        self._width = w
         self._rect.width = w
 
     @property
@@ -354,10 +939,7 @@ class ImgObj(pg.sprite.Sprite):
         if not isinstance(direction, tuple) and len(direction) == 2:
             raise TypeError('{} direction must be tuple len 2.'
                             ''.format(repr(self)))
-        x, y = direction
-        self._x += x
-        self._y += y
-        self._rect.move_ip(x, y)
+        self._rect.move_ip(direction)
 
     def random_pos(self):
         return (self.x + random.randrange(self.width),
@@ -391,17 +973,63 @@ class ImgObj(pg.sprite.Sprite):
         surface.blit(self.image, self.rect)
 
 
+class TextCache(object):
+    '''
+    Process wide cache of fonts, keyed by (name, height), and a least
+    recently used cache of rendered text Surfaces, keyed by everything that
+    affects the rendering. SysFont scans the system fonts, so each font is
+    only ever created once.
+    '''
+    def __init__(self, size=TEXT_CACHE_SIZE):
+        self.size = size
+        self.fonts = {}
+        self.rendered = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return 'TextCache: {} fonts, {} renders, {} hits, {} misses'.format(
+            len(self.fonts), len(self.rendered), self.hits, self.misses)
+
+    def font(self, name, height):
+        try:
+            return self.fonts[(name, height)]
+        except KeyError:
+            init()
+            font = self.fonts[(name, height)] = pg.font.SysFont(name, height)
+            return font
+
+    def render(self, string, font_name, color, height, antialias=True):
+        key = (string, font_name, tuple(color), height, antialias)
+        image = self.rendered.pop(key, None)
+        if image is None:
+            self.misses += 1
+            font = self.font(font_name, height)
+            image = font.render(string, antialias, color)
+            if len(self.rendered) >= self.size:
+                self.rendered.popitem(last=False)
+        else:
+            self.hits += 1
+        self.rendered[key] = image
+        return image
+
+
+TEXT_CACHE = TextCache()
+
+
 class Text(ImgObj):
     '''
     All text objects to be rendered in the game.
     '''
+    __slots__ = ('string', 'font_name', 'font_height', 'color', 'font')
+
     def __init__(self, string, font_name, color, height, *args, **kwargs):
         self.string = string
         self.font_name = font_name
         self.font_height = height
         self.color = color
-        self.font = pg.font.SysFont(font_name, height)
-        image = self.font.render(string, True, color)
+        self.font = TEXT_CACHE.font(font_name, height)
+        image = TEXT_CACHE.render(string, font_name, color, height)
         super(Text, self).__init__(*args, image=image, **kwargs)
 
     def __str__(self):
@@ -412,15 +1040,21 @@ class Text(ImgObj):
         del self.font
 
     def update(self, pos=OFFSCREEN, string=None, color=None, height=None):
-        if color:
+        changed = False
+        if color and color != self.color:
             self.color = color
-        if string:
+            changed = True
+        if string and string != self.string:
             self.string = string
-        if height:
+            changed = True
+        if height and height != self.font_height:
             self.font_height = height
-        self.font = pg.font.SysFont(self.font_name, self.font_height)
-        self.image = self.font.render(self.string, True, self.color)
-        self.rect = self.image.get_rect()
+            self.font = TEXT_CACHE.font(self.font_name, self.font_height)
+            changed = True
+        if changed:
+            self.image = TEXT_CACHE.render(self.string, self.font_name,
+                                           self.color, self.font_height)
+            self.rect = self.image.get_rect()
         self.pos = pos
 
 
@@ -450,7 +1084,7 @@ class MessageScreen(object):
             '\n'.join([str(m) for m in self.messages]))
 
     def update(self, keys):
-        self.cooldown -= 1
+        self.cooldown -= TICK
         if keys[SPACE] and self.cooldown <= 0:
             print('{} next mode func triggered: {}'.format(self, self.next_mode_func))
             self.next_mode_func()
@@ -491,16 +1125,43 @@ class Animator(object):
         cleanup(self)
 
 
+class ViewCuller(object):
+    '''
+    Draws only the objects whose rects intersect the view, counting how many
+    were drawn and how many were culled since the last reset.
+    '''
+    def __init__(self, view_rect=SCREEN_RECT):
+        self.view_rect = view_rect
+        self.drawn = 0
+        self.culled = 0
+
+    def __str__(self):
+        return 'ViewCuller: {} drawn, {} culled'.format(self.drawn,
+                                                        self.culled)
+
+    def reset(self):
+        self.drawn = 0
+        self.culled = 0
+
+    def draw(self, obj, surface):
+        if obj.rect.colliderect(self.view_rect):
+            obj.draw(surface)
+            self.drawn += 1
+            return True
+        self.culled += 1
+        return False
+
+
 class Player(ImgObj):
     '''
     The player sprite object existing at the cente of the screen.
     '''
     def __init__(self, *args, **kwargs):
-        self.frames = get_player_frames()
-        self.anim_counter = PLAYER_ANIM_RATE - 1
+        self.frames = SPRITE_ATLAS.get(PLAYER_FRAMES_KEY)
+        self.anim_time = PLAYER_ANIM_TIME
         self.direction = DIRECTIONS[LEFT]
         self.moving_frames = {
-            di: Animator([pg.transform.rotate(f, de) for f in self.frames])
+            di: Animator(SPRITE_ATLAS.get(PLAYER_FRAMES_KEY, de))
             for di, de in DI_DE.items()}
 
         super(Player, self).__init__(image=self.frames[0], *args, **kwargs)
@@ -508,52 +1169,266 @@ class Player(ImgObj):
     def move(self, direction):
         if direction:
             self.direction = direction
-            self.anim_counter += 1
-            if self.anim_counter > PLAYER_ANIM_RATE:
+            self.anim_time += TICK
+            if self.anim_time >= PLAYER_ANIM_TIME:
                 self.image = self.moving_frames[self.direction].next()
-                self.anim_counter = 0
+                self.anim_time = 0.0
         else:
-            self.anim_counter = PLAYER_ANIM_RATE
+            self.anim_time = PLAYER_ANIM_TIME
             self.moving_frames[self.direction].reset()
             self.image = self.moving_frames[self.direction].first()
 
 
+def chunk_key(cell):
+    x, y = cell
+    return (x // CHUNK_SIZE, y // CHUNK_SIZE)
+
+
+class Chunk(object):
+    '''
+    CHUNK_SIZE by CHUNK_SIZE cells of the world, generated from the world
+    seed and the chunk's coordinates alone, so that a chunk which is evicted
+    and generated again comes back the same. Holds the tile file and
+    rotation of each cell and the spots tigers are placed on.
+    '''
+    def __init__(self, seed, key, tile_files):
+        self.seed = seed
+        self.key = key
+        rng = random.Random('{}:{}:{}'.format(seed, *key))
+        self.tiles = [[(rng.choice(tile_files), rng.choice(DEGREES))
+                       for x in range(CHUNK_SIZE)]
+                      for y in range(CHUNK_SIZE)]
+        self.spots = {}
+
+    def tile(self, cell):
+        x, y = cell
+        return self.tiles[y % CHUNK_SIZE][x % CHUNK_SIZE]
+
+    def spot(self, cell, k=0):
+        '''
+        Returns the offset from the topleft corner of the tile at cell and
+        the rotation of the k-th tiger placed there.
+        '''
+        try:
+            return self.spots[(cell, k)]
+        except KeyError:
+            rng = random.Random('{}:{}:{}:{}'.format(self.seed, cell[0],
+                                                     cell[1], k))
+            spot = ((rng.randrange(TILE_SIZE), rng.randrange(TILE_SIZE)),
+                    rng.choice(DEGREES))
+            self.spots[(cell, k)] = spot
+            return spot
+
+
+class World(object):
+    '''
+    The endless map, made of chunks generated on demand from the seed. The
+    world is addressed by cell, the coordinates of a tile, with the player
+    starting on cell (0, 0). Chunks are kept in a least recently used cache
+    of at most size chunks, so memory stays flat however far the player
+    walks, and the chunks around the player are generated ahead of time on
+    a background thread. Tigers keep the cell they were settled on.
+    '''
+    def __init__(self, seed=None, size=CHUNK_CACHE_SIZE):
+        self.size = size
+        self.tile_files = TILE_CACHE.index()
+        self.chunks = collections.OrderedDict()
+        self.tigers = collections.defaultdict(list)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.worker = None
+        self.hits = 0
+        self.misses = 0
+        self.reset(seed)
+
+    def __str__(self):
+        return 'World {}: {} / {} chunks, {} hits, {} misses'.format(
+            self.seed, len(self.chunks), self.size, self.hits, self.misses)
+
+    def reset(self, seed=None):
+        '''
+        Starts the world over from seed, or from a random seed, keeping the
+        cache and its background thread.
+        '''
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        with self.lock:
+            self.seed = seed
+            self.chunks.clear()
+        self.tigers.clear()
+
+    def reserve(self, radius):
+        '''
+        Grows the cache to fit every chunk within radius cells of the player.
+        '''
+        span = 2 * radius // CHUNK_SIZE + 2
+        self.size = max(self.size, span * span)
+
+    def insert(self, key, chunk):
+        with self.lock:
+            if chunk.seed != self.seed:
+                # generated in the background for the world before a reset
+                return chunk
+            if key in self.chunks:
+                return self.chunks[key]
+            self.chunks[key] = chunk
+            while len(self.chunks) > self.size:
+                self.chunks.popitem(last=False)
+            return chunk
+
+    def chunk(self, cell):
+        key = chunk_key(cell)
+        with self.lock:
+            chunk = self.chunks.pop(key, None)
+            if chunk is not None:
+                self.chunks[key] = chunk
+                self.hits += 1
+                return chunk
+            self.misses += 1
+        return self.insert(key, Chunk(self.seed, key, self.tile_files))
+
+    def tile_image(self, cell):
+        filename, degrees = self.chunk(cell).tile(cell)
+        return TILE_CACHE.get(filename, degrees)
+
+    def settle(self, tigers, cells):
+        '''
+        Deals the tigers out over cells, in an order fixed by the seed, and
+        gives each its spot on its cell.
+        '''
+        cells = sorted(cells)
+        random.Random('{}:settle'.format(self.seed)).shuffle(cells)
+        for i, tiger in enumerate(tigers):
+            cell = cells[i % len(cells)]
+            tiger.offset, degrees = self.chunk(cell).spot(cell,
+                                                          i // len(cells))
+            tiger.rotate(degrees)
+            self.tigers[cell].append(tiger)
+
+    def tigers_at(self, cell):
+        return [tiger for tiger in self.tigers.get(cell, ())
+                if not tiger.petted]
+
+    def prefetch(self, center, radius):
+        '''
+        Generates the chunks within radius cells of center on the background
+        thread, and marks those already in the cache as recently used, so
+        that only chunks far from the player are evicted.
+        '''
+        x, y = center
+        x0, y0 = chunk_key((x - radius, y - radius))
+        x1, y1 = chunk_key((x + radius, y + radius))
+        for key in [(cx, cy) for cy in range(y0, y1 + 1)
+                    for cx in range(x0, x1 + 1)]:
+            with self.lock:
+                if key in self.chunks:
+                    self.chunks[key] = self.chunks.pop(key)
+                    continue
+                if key in self.pending:
+                    continue
+                self.pending.add(key)
+            self.requests.put(key)
+        if self.worker is None and self.pending:
+            self.worker = threading.Thread(target=self.run_prefetch)
+            self.worker.daemon = True
+            self.worker.start()
+
+    def run_prefetch(self):
+        while True:
+            key = self.requests.get()
+            try:
+                with self.lock:
+                    resident = key in self.chunks
+                if not resident:
+                    self.insert(key, Chunk(self.seed, key, self.tile_files))
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+
 class Tile(ImgObj):
     '''
-    Jungle tile making up the map of the world. It is randomly selected and
-    rotated.
+    Jungle tile making up the map of the world, showing the world cell it is
+    loaded with. Each tile is also the spatial index for the tigers on its
+    cell, which move along with it: tigers are bucketed by their position
+    on the tile in a uniform grid of TILE_BUCKET_SIZE cells.
     '''
-    def __init__(self, matrix_pos, tile_pos_in_matrix, *args, **kwargs):
-        self.pos_in_matrix = tile_pos_in_matrix
-        pos = rel_tile_pos(matrix_pos, tile_pos_in_matrix)
+    __slots__ = ('world', 'cell', 'tigers', 'buckets')
+
+    def __init__(self, pos, world, cell, *args, **kwargs):
         super(Tile, self).__init__(*args,
                                    pos=pos,
-                                   image=load_rand_tile(),
+                                   image=world.tile_image(cell),
                                    width=TILE_SIZE,
                                    height=TILE_SIZE,
                                    **kwargs)
-        self.random_rotate()
-        self.tiger = None
+        self.world = world
+        self.cell = None
+        self.tigers = []
+        self.buckets = collections.defaultdict(list)
+        self.load(cell)
 
     def __str__(self):
-        return 'Tile {} at {}'.format(self.pos_in_matrix, self.pos)
+        return 'Tile {} at {}'.format(self.cell, self.pos)
 
-    def place_tiger(self, tiger):
-        self.tiger = tiger
-        self.tiger.pos = self.random_pos()
-        self.tiger.random_rotate()
+    def bucket_key(self, pos):
+        x, y = pos
+        return (int(x - self.x) // TILE_BUCKET_SIZE,
+                int(y - self.y) // TILE_BUCKET_SIZE)
 
-    def reposition(self, matrix_pos, direction=(0, 0), shuffle=False):
-        self.pos = rel_tile_pos(matrix_pos, self.pos_in_matrix, direction)
-        if shuffle:
-            print('shuffle {}'.format(shuffle))
-            self.image = load_rand_tile()
-            if self.tiger:
-                self.place_tiger(self.tiger)
+    def place_tiger(self, tiger):
+        if tiger.tile:
+            tiger.tile.remove_tiger(tiger)
+        tiger.pos = (self.x + tiger.offset[0], self.y + tiger.offset[1])
+        tiger.tile = self
+        tiger.bucket = self.bucket_key(tiger.pos)
+        self.tigers.append(tiger)
+        self.buckets[tiger.bucket].append(tiger)
+
+    def remove_tiger(self, tiger):
+        self.tigers.remove(tiger)
+        self.buckets[tiger.bucket].remove(tiger)
+        tiger.tile = None
+
+    def tigers_near(self, rect):
+        '''
+        Returns the tigers on this tile whose rects may overlap rect.
+        '''
+        # a tiger reaches at most its longest side (plus a tick of movement)
+        # past the bucket its topleft corner is in
+        reach = TIGER_H + int(math.ceil(MOVE_SPEED * TICK))
+        last = TILE_SIZE // TILE_BUCKET_SIZE
+        x0, y0 = self.bucket_key((rect.left - reach, rect.top - reach))
+        x1, y1 = self.bucket_key(rect.bottomright)
+        return [tiger
+                for by in range(max(y0, 0), min(y1, last) + 1)
+                for bx in range(max(x0, 0), min(x1, last) + 1)
+                for tiger in self.buckets.get((bx, by), ())]
+
+    def load(self, cell):
+        '''
+        Shows the world cell at cell on this tile, along with its tigers.
+        '''
+        self.cell = cell
+        self.image = self.world.tile_image(cell)
+        for tiger in self.tigers:
+            tiger.tile = None
+        self.tigers = []
+        self.buckets.clear()
+        for tiger in self.world.tigers_at(cell):
+            self.place_tiger(tiger)
 
 
 class TileMatrix(ImgObj):
-    def __init__(self, size, tigers, *args, **kwargs):
+    '''
+    Square of tiles centered on the player, stored as a ring buffer: the
+    tile at matrix position (x, y) is cells[(y + oy) % size][(x + ox) % size]
+    for the current origin (ox, oy). Tile screen positions are derived from
+    the matrix position and only brought up to date when a tile is looked
+    up, so moving the matrix and repositioning it don't touch every tile.
+    '''
+    def __init__(self, size, tigers, world, *args, **kwargs):
         super(TileMatrix, self).__init__(*args,
                                          width=TILE_SIZE * size,
                                          height=TILE_SIZE * size,
@@ -562,22 +1437,42 @@ class TileMatrix(ImgObj):
                                              'an odd number at least 5')
         self.size = int(size)
         self.index_range = range(size)
-        self.center_index = size / 2
-        self.tiles = set([Tile(self.pos, (matrix_x, matrix_y))
-                          for matrix_y in self.index_range
-                          for matrix_x in self.index_range])
+        self.center_index = size // 2
+        # decode every tile up front so walking never touches the disk
+        TILE_CACHE.preload()
+        self.world = world
+        self.origin = (0, 0)
+        # the world cell at matrix position (0, 0); the player starts on the
+        # world's cell (0, 0)
+        self.corner = (-self.center_index, -self.center_index)
+        self.prefetch_radius = self.center_index + CHUNK_SIZE
+        world.reserve(self.prefetch_radius)
+
+        # deal the tigers out around the player, leaving the player's cell
+        # free
+        world.settle(tigers, [self.world_cell((x, y))
+                              for y in self.index_range
+                              for x in self.index_range
+                              if x != self.center_index or
+                              y != self.center_index])
+        self.cells = [[Tile(rel_tile_pos(self.pos, (matrix_x, matrix_y)),
+                            world, self.world_cell((matrix_x, matrix_y)))
+                       for matrix_x in self.index_range]
+                      for matrix_y in self.index_range]
         self.update_pos()
-
-        tiles = list(self.tiles)
-        random.shuffle(tiles)
-
-        for tile in tiles:
-            if tile != self.center_tile:
-                try:
-                    if not tile.tiger:
-                        tile.place_tiger(tigers.pop())
-                except IndexError:
-                    pass
+        world.prefetch((0, 0), self.prefetch_radius)
+
+        # only the tiles around the center that can reach the screen are
+        # composited into the background, so drawing is a single blit
+        self.view_cells = tuple(
+            min(int(math.ceil(float(xy) / TILE_SIZE)), self.size // 2)
+            for xy in CENTER_FRAME_POS)
+        self.view_origin = tuple(self.size // 2 - k for k in self.view_cells)
+        # made in the display's format to begin with, rather than converted
+        self.background = pg.Surface(tuple(
+            (2 * k + 1) * TILE_SIZE for k in self.view_cells), 0,
+            get_frame())
+        self.composite()
 
     def __str__(self):
         tiles = '\n'.join([' | '.join(
@@ -588,54 +1483,150 @@ class TileMatrix(ImgObj):
 
     def reposition(self, direction):
         '''
-        Repositions all Tiles in the matrix when the center tile moves off of
-        the center point where the player is.
-        This creates the illusion of a constant unending map.
-        '''
-        for tile in self.tiles:
-            tile.pos_in_matrix = tuple(map(lambda txy, dxy:
-                                       (txy - dxy) % self.size,
-                                       tile.pos_in_matrix, direction))
-            shuffle = any(map(lambda txy, dxy:
-                          (txy, dxy) == (0, -1) or (txy, dxy) == (self.size - 1, 1),
-                          tile.pos_in_matrix, direction))
-            tile.reposition(self.pos, direction, shuffle)
+        Repositions the matrix when the center tile moves off of the center
+        point where the player is, by moving the ring buffer's origin one
+        tile in direction. The strip of tiles that wraps around to the
+        leading edge is loaded with the world cells now under it, and the
+        world is asked to generate the chunks ahead of the player.
+        '''
+        dx, dy = direction
+        self.origin = tuple((oxy + dxy) % self.size
+                            for oxy, dxy in zip(self.origin, direction))
+        self.corner = (self.corner[0] + dx, self.corner[1] + dy)
+        super(TileMatrix, self).move((dx * TILE_SIZE, dy * TILE_SIZE))
+        for pos_in_matrix in self.edge_strip(direction):
+            self.get_tile(pos_in_matrix).load(self.world_cell(pos_in_matrix))
         self.update_pos()
+        self.world.prefetch(self.center_tile.cell, self.prefetch_radius)
+        self.background.scroll(*[-dxy * TILE_SIZE for dxy in direction])
+        self.composite(direction)
+
+    def edge_strip(self, direction):
+        '''
+        Returns the matrix positions along the leading edge of the matrix in
+        direction.
+        '''
+        dx, dy = direction
+        edge = self.size - 1
+        strip = []
+        if dx:
+            x = edge if dx > 0 else 0
+            strip.extend((x, y) for y in self.index_range)
+        if dy:
+            y = edge if dy > 0 else 0
+            strip.extend((x, y) for x in self.index_range
+                         if not (dx and x == (edge if dx > 0 else 0)))
+        return strip
+
+    def composite(self, direction=(0, 0)):
+        '''
+        Blits the tiles in view onto the background surface. Given the
+        direction of a reposition, only the strip of tiles that entered the
+        view on that side is redrawn.
+        '''
+        cols, rows = [2 * k + 1 for k in self.view_cells]
+        dx, dy = direction
+        ox, oy = self.view_origin
+        for vy in range(rows):
+            for vx in range(cols):
+                if direction != (0, 0) and not (
+                        (dx > 0 and vx == cols - 1) or (dx < 0 and vx == 0) or
+                        (dy > 0 and vy == rows - 1) or (dy < 0 and vy == 0)):
+                    continue
+                tile = self.get_tile((ox + vx, oy + vy))
+                self.background.blit(tile.image,
+                                     (vx * TILE_SIZE, vy * TILE_SIZE))
 
     def update_pos(self):
-        self.center_tile = self.get_tile((self.center_index, self.center_index))
+        self.center_tile = self.get_tile((self.center_index,
+                                          self.center_index))
         print('Update pos: Center tile: {}'.format(self.center_tile))
-        self.pos = self.get_tile((0, 0)).topleft
         print('Update pos: tile_matrix.pos: {}'.format(self.pos))
 
+    def world_cell(self, pos_in_matrix):
+        return (self.corner[0] + pos_in_matrix[0],
+                self.corner[1] + pos_in_matrix[1])
+
     def get_tile(self, pos_in_matrix):
-        return filter(lambda t: t.pos_in_matrix == pos_in_matrix, self.tiles)[0]
+        x, y = pos_in_matrix
+        ox, oy = self.origin
+        tile = self.cells[(y + oy) % self.size][(x + ox) % self.size]
+        tile.pos = rel_tile_pos(self.pos, pos_in_matrix)
+        return tile
 
-    def off_center(self):
-        return not self.center_tile.collide_pos(CENTER_FRAME_POS)
+    def tiles_around(self, pos_in_matrix, radius=1):
+        '''
+        Returns the tile at pos_in_matrix and its neighbours within radius.
+        '''
+        x, y = pos_in_matrix
+        return [self.get_tile((nx, ny))
+                for ny in range(max(y - radius, 0),
+                                min(y + radius + 1, self.size))
+                for nx in range(max(x - radius, 0),
+                                min(x + radius + 1, self.size))]
+
+    def tiles_in_view(self, margin=1):
+        '''
+        Returns the tiles inside the background's view window, plus margin
+        tiles around it for objects which overhang the edge of their tile.
+        '''
+        (ox, oy), (kx, ky) = self.view_origin, self.view_cells
+        xs = range(max(ox - margin, 0),
+                   min(ox + 2 * kx + 1 + margin, self.size))
+        ys = range(max(oy - margin, 0),
+                   min(oy + 2 * ky + 1 + margin, self.size))
+        return [self.get_tile((x, y)) for y in ys for x in xs]
 
-    def move(self, direction):
-        super(TileMatrix, self).move(mirror_direction(direction))
-        for tile in self.tiles:
-            tile.move(mirror_direction(direction))
-        if self.off_center():
+    def off_center(self):
+        '''
+        Returns the direction, one tile at most on each axis, from the
+        center tile towards the tile under the player at the center of the
+        frame, or None when the player is on the center tile.
+        '''
+        c = self.center_index * TILE_SIZE
+        direction = tuple(
+            min(max(int((center - xy - c) // TILE_SIZE), -1), 1)
+            for center, xy in zip(CENTER_FRAME_POS, self.pos))
+        return direction if direction != (0, 0) else None
+
+    def move(self, step):
+        super(TileMatrix, self).move(mirror_direction(step))
+        direction = self.off_center()
+        while direction:
             print('Tile off center; redrawing.')
             self.reposition(direction)
+            direction = self.off_center()
 
     def draw(self, surface):
-        for tile in self.tiles:
-            tile.draw(surface)
+        ox, oy = self.view_origin
+        surface.blit(self.background,
+                     (self.x + ox * TILE_SIZE, self.y + oy * TILE_SIZE))
 
 
 class Tiger(ImgObj):
-    def __init__(self, picture, *args, **kwargs):
+    '''
+    A wild tiger on the map. When its TigerManager uses TigerArrays, the
+    arrays hold the tiger's position and roar state and the Tiger is a thin
+    view of them, brought up to date with TigerArrays.sync before drawing.
+    '''
+    __slots__ = ('picture_file', 'picture', '_tile', 'bucket', 'offset',
+                 'roar', 'roar_timer', 'petted', 'desired_pet_speed',
+                 'too_fast', 'too_slow', 'roar_min', 'roar_max', 'arrays',
+                 'index')
+
+    def __init__(self, picture_file, *args, **kwargs):
+        self.arrays = None
+        self.index = None
         super(Tiger, self).__init__(*args,
-                                    image=load_tiger_sprite(),
+                                    image=SPRITE_ATLAS.first(TIGER_SPRITE_KEY),
                                     width=TIGER_W,
                                     height=TIGER_H,
                                     **kwargs)
-        self.picture = ImgObj(image=picture, pos=CENTER_FRAME_POS,
-                              alignment=CENTER)
+        self.picture_file = picture_file
+        self.picture = None
+        self.tile = None
+        self.bucket = None
+        self.offset = (0, 0)
         self.roar = Text('ROAR', DEFAULT_FONT, BLACK, ROAR_HEIGHT_NEAR,
                          alignment=CENTER)
         self.roar_timer = 0
@@ -643,41 +1634,304 @@ class Tiger(ImgObj):
         self.desired_pet_speed = random.randrange(MIN_PET_SPEED, MAX_PET_SPEED)
         self.too_fast = self.desired_pet_speed * TOO_FAST_MOD
         self.too_slow = self.desired_pet_speed * TOO_SLOW_MOD
-        self.roar_min = random.randrange(ROAR_MIN, ROAR_MAX)
-        self.roar_max = random.randrange(self.roar_min, ROAR_MAX)
+        self.roar_min = random.uniform(ROAR_MIN, ROAR_MAX)
+        self.roar_max = random.uniform(self.roar_min, ROAR_MAX)
 
     def update(self, tile_matrix):
         x, y = OFFSCREEN
-        self.roar_timer += 1
+        self.roar_timer += TICK
         if self.roar_timer >= self.roar_max:
             self.roar_timer = 0
         if self.roar_timer >= self.roar_min:
-            if self.x not in range(FRAME_WIDTH):
-                x = 30  # fix to something more specific
+            if not 0 <= self.x < FRAME_WIDTH:
+                x = ROAR_EDGE_OFFSET  # fix to something more specific
                 y = self.y
-            if self.y not in range(FRAME_HEIGHT):
+            if not 0 <= self.y < FRAME_HEIGHT:
                 x = self.x
-                y = 30
+                y = ROAR_EDGE_OFFSET
         if distance(self.pos, CENTER_FRAME_POS) > ROAR_DISTANCE:
             height = ROAR_HEIGHT_FAR
         else:
             height = ROAR_HEIGHT_NEAR
         self.roar.update(pos=(x, y), height=height)
 
+    @property
+    def pos(self):
+        return getattr(self._rect, self.alignment)
+
+    @pos.setter
+    def pos(self, pos):
+        ImgObj.pos.fset(self, pos)
+        if self.arrays is not None:
+            self.arrays.pos[self.index] = pos
+            self.arrays.size[self.index] = self.rect.size
+
+    @property
+    def tile(self):
+        return self._tile
+
+    @tile.setter
+    def tile(self, tile):
+        self._tile = tile
+        if self.arrays is not None:
+            self.arrays.on_tile[self.index] = tile is not None
+
+    def rotate(self, degrees):
+        pos = tuple(self.pos)
+        self.image = SPRITE_ATLAS.first(TIGER_SPRITE_KEY, degrees)
+        self.rect = self.image.get_rect()
+        self.pos = pos
+
+    def show_picture(self, picture):
+        self.picture = ImgObj(image=picture, pos=CENTER_FRAME_POS,
+                              alignment=CENTER)
+
     def draw_picture(self, surface):
         self.picture.draw(surface)
 
-    def draw(self, surface):
-        super(Tiger, self).draw(surface)
-        self.roar.draw(surface)
+
+class TigerArrays(object):
+    '''
+    Structure of arrays backend for TigerManager: the positions and roar
+    timers of all tigers live in NumPy arrays, so that updating, moving and
+    placing the roars of every tiger takes a few vectorized operations per
+    frame. Tiger objects are synced from the arrays only when they are
+    about to be drawn or collided with.
+    '''
+    def __init__(self, tigers):
+        self.tigers = tigers
+        n = len(tigers)
+        self.pos = np.zeros((n, 2), dtype=np.int64)
+        self.size = np.zeros((n, 2), dtype=np.int64)
+        self.roar_pos = np.zeros((n, 2), dtype=np.int64)
+        self.roar_timer = np.zeros(n)
+        self.roar_min = np.array([t.roar_min for t in tigers])
+        self.roar_max = np.array([t.roar_max for t in tigers])
+        self.distance = np.zeros(n)
+        self.active = np.ones(n, dtype=bool)
+        # tigers whose cell has scrolled out of the tile matrix aren't drawn
+        self.on_tile = np.array([t.tile is not None for t in tigers],
+                                dtype=bool)
+        for i, tiger in enumerate(tigers):
+            tiger.index = i
+            tiger.arrays = self
+            self.pos[i] = tiger.pos
+            self.size[i] = tiger.rect.size
+        self.roar_sizes = {
+            height: TEXT_CACHE.render('ROAR', DEFAULT_FONT, BLACK,
+                                      height).get_size()
+            for height in (ROAR_HEIGHT_NEAR, ROAR_HEIGHT_FAR)}
+
+    def deactivate(self, tiger):
+        self.active[tiger.index] = False
+
+    def sync(self, tigers):
+        for tiger in tigers:
+            x, y = self.pos[tiger.index]
+            ImgObj.pos.fset(tiger, (int(x), int(y)))
+
+    def update(self):
+        '''
+        Vectorized Tiger.update for every active tiger.
+        '''
+        active = self.active
+        self.roar_timer[active] += TICK
+        self.roar_timer[self.roar_timer >= self.roar_max] = 0
+        roaring = active & (self.roar_timer >= self.roar_min)
+        x, y = self.pos[:, 0], self.pos[:, 1]
+        self.roar_pos[:] = OFFSCREEN
+        off_x = roaring & ((x < 0) | (x >= FRAME_WIDTH))
+        self.roar_pos[off_x, 0] = ROAR_EDGE_OFFSET
+        self.roar_pos[off_x, 1] = y[off_x]
+        off_y = roaring & ((y < 0) | (y >= FRAME_HEIGHT))
+        self.roar_pos[off_y, 0] = x[off_y]
+        self.roar_pos[off_y, 1] = ROAR_EDGE_OFFSET
+        self.distance = np.hypot(x - CENTER_FRAME_X, y - CENTER_FRAME_Y)
+
+    def move(self, direction):
+        self.pos[self.active] += direction
+        self.roar_pos[self.active] += direction
+
+    def tigers_in_view(self):
+        '''
+        Syncs and returns the active tigers on a tile of the matrix whose
+        rects are on the screen.
+        '''
+        x, y = self.pos[:, 0], self.pos[:, 1]
+        w, h = self.size[:, 0], self.size[:, 1]
+        visible = (self.active & self.on_tile &
+                   (x < FRAME_WIDTH) & (x + w > 0) &
+                   (y < FRAME_HEIGHT) & (y + h > 0))
+        tigers = [self.tigers[i] for i in np.flatnonzero(visible)]
+        self.sync(tigers)
+        return tigers
+
+    def roars_in_view(self):
+        '''
+        Updates and returns the roar Texts of the active tigers whose roar
+        would land on the screen.
+        '''
+        near = self.distance <= ROAR_DISTANCE
+        w = np.where(near, self.roar_sizes[ROAR_HEIGHT_NEAR][0],
+                     self.roar_sizes[ROAR_HEIGHT_FAR][0])
+        h = np.where(near, self.roar_sizes[ROAR_HEIGHT_NEAR][1],
+                     self.roar_sizes[ROAR_HEIGHT_FAR][1])
+        left = self.roar_pos[:, 0] - w // 2
+        top = self.roar_pos[:, 1] - h // 2
+        visible = (self.active & (left < FRAME_WIDTH) & (left + w > 0) &
+                   (top < FRAME_HEIGHT) & (top + h > 0))
+        roars = []
+        for i in np.flatnonzero(visible):
+            roar = self.tigers[i].roar
+            x, y = self.roar_pos[i]
+            height = ROAR_HEIGHT_NEAR if near[i] else ROAR_HEIGHT_FAR
+            roar.update(pos=(int(x), int(y)), height=height)
+            roars.append(roar)
+        return roars
+
+
+class PetSpeedMeter(object):
+    '''
+    Measures petting speed in pixels per second over the last
+    PET_SPEED_WINDOW seconds. Mouse travel is summed into a ring buffer of
+    NUM_PETS time slots with a running total, so adding a sample and reading
+    the speed are O(1), whatever the frame rate or mouse event rate.
+    '''
+    def __init__(self, slots=NUM_PETS, window=PET_SPEED_WINDOW):
+        self.slots = [0.0] * slots
+        self.window = window
+        self.slot_time = float(window) / slots
+        self.total = 0.0
+        self.slot = -1  # game time starts at 0
+        self.start = None
+        self.last_pos = None
+
+    def advance(self, now):
+        slot = int(now / self.slot_time)
+        if slot <= self.slot:
+            return
+        if self.start is None:
+            self.slot = slot
+            self.start = now
+            return
+        size = len(self.slots)
+        for i in range(self.slot + 1, min(slot, self.slot + size) + 1):
+            self.total -= self.slots[i % size]
+            self.slots[i % size] = 0.0
+        self.slot = slot
+        self.total = max(self.total, 0.0)
+
+    def add(self, pos, pressed, now):
+        # called for every mouse event, so distance() is inlined
+        self.advance(now)
+        if pressed and self.last_pos is not None:
+            dist = math.hypot(pos[0] - self.last_pos[0],
+                              pos[1] - self.last_pos[1])
+            self.slots[self.slot % len(self.slots)] += dist
+            self.total += dist
+        self.last_pos = pos if pressed else None
+
+    def speed(self, now):
+        self.advance(now)
+        elapsed = min(now - self.start, self.window)
+        return self.total / max(elapsed, self.slot_time)
+
+
+class PetSession(object):
+    '''
+    The scoring of one petting session, free of any rendering, so that it
+    can be driven by synthetic mouse traces as well as by the game. track
+    feeds it mouse positions and tick advances it by one tick of dt
+    seconds, returning PURR, YAWN or GRRR once the session is over. reaction
+    is the tiger's reaction to the current petting speed.
+    '''
+    def __init__(self, desired_pet_speed, too_fast, too_slow,
+                 yawn_max=YAWN_MAX, grrr_max=GRRR_MAX,
+                 petting_time=PETTING_TIME):
+        self.desired_pet_speed = desired_pet_speed
+        self.too_fast = too_fast
+        self.too_slow = too_slow
+        self.yawn_max = yawn_max
+        self.grrr_max = grrr_max
+        self.petting_time = petting_time
+        self.speed_meter = PetSpeedMeter()
+        self.pet_speed = 0.0
+        self.reaction = None
+        self.purr_score = 0
+        self.yawn_score = 0
+        self.grrr_score = 0
+
+    @classmethod
+    def for_tiger(cls, tiger):
+        return cls(tiger.desired_pet_speed, tiger.too_fast, tiger.too_slow)
+
+    def track(self, pos, pressed, now):
+        self.speed_meter.add(pos, pressed, now)
+
+    def tick(self, now, dt=TICK):
+        self.petting_time -= dt
+        speed = self.pet_speed = self.speed_meter.speed(now)
+        if speed >= self.too_fast:
+            self.grrr_score += abs(speed - self.too_fast) * dt
+            self.reaction = GRRR
+        elif speed <= self.too_slow:
+            self.yawn_score += abs(speed - self.too_slow) * dt
+            self.reaction = YAWN
+        else:
+            off = abs(speed - self.desired_pet_speed)
+            self.purr_score += PURR_RATE / max(off, PET_SPEED_TOLERANCE) * dt
+            self.reaction = PURR
+
+        if self.petting_time <= 0:
+            return PURR
+        elif self.yawn_score >= self.yawn_max:
+            return YAWN
+        elif self.grrr_score >= self.grrr_max:
+            return GRRR
+        return None
+
+
+def simulate_petting(session, trace, dt=TICK):
+    '''
+    Runs session against a synthetic mouse trace, an iterable of (time,
+    pos, pressed) samples in time order, the way the game would: every
+    sample up to the end of a tick is tracked before that tick. Once the
+    trace runs out the mouse is left where it was. Returns the result and
+    the purr score.
+    '''
+    samples = iter(trace)
+    sample = next(samples, None)
+    now = 0.0
+    while True:
+        now += dt
+        while sample is not None and sample[0] <= now:
+            session.track(sample[1], sample[2], sample[0])
+            sample = next(samples, None)
+        result = session.tick(now, dt)
+        if result:
+            return result, session.purr_score
 
 
 class TigerManager(object):
     '''
     Handles all Tiger objects for both movement on map as well as petting.
     '''
-    def __init__(self, num_tigers):
-        self.tigers = [Tiger(pic) for pic in load_tiger_pics(num_tigers)]
+    def __init__(self, num_tigers, progress=None, pictures=None):
+        picture_files = tiger_pic_paths(num_tigers)
+        self.pictures = PictureCache() if pictures is None else pictures
+        self.pictures.store(picture_files, progress)
+        self.tigers = [Tiger(picture_file) for picture_file in picture_files]
+        # both backends draw tigers in this order, so overlaps look the same
+        for i, tiger in enumerate(self.tigers):
+            tiger.index = i
+        # kept up to date as tigers are petted instead of being rescanned
+        self.active = list(self.tigers)
+        self.petted_count = 0
+        if TIGER_ARRAYS and np is not None:
+            self.arrays = TigerArrays(self.tigers)
+        else:
+            self.arrays = None
+        self.prefetch_counter = 0
         self.pet_text = Text('', DEFAULT_FONT, ORANGE, PET_TEXT_HEIGHT,
                              pos=PET_TEXT_CENTER, alignment=CENTER)
         self.pet_bar = ImgObj(height=PET_BAR_HEIGHT, width=1,
@@ -686,6 +1940,7 @@ class TigerManager(object):
                                   pos=SCORE_COUNTER_POS)
         self.petted_counter = Text('', DEFAULT_FONT, BLUE, 20,
                                    pos=PETTED_COUNTER_POS)
+        self.culler = ViewCuller()
         self.total_score = 0
         self.reset()
 
@@ -698,89 +1953,111 @@ class TigerManager(object):
                                       int(self.total_score)))
         self.petted_counter.update(pos=PETTED_COUNTER_POS,
                                    string='Tigers Petted: {} / {}'.format(
-                                       len(self.tigers) - len(self.tigers_to_pet()),
-                                       len(self.tigers)))
+                                       self.petted_count, len(self.tigers)))
         self.tiger_to_pet = None
-        self.last_pet_pos = None
-        self.distances = []  # give a better starting list of distances
-        self.purr_score = 0
-        self.yawn_score = 0
-        self.grrr_score = 0
-        self.petting_time = PETTING_TIME
+        self.session = None
+
+    def start_petting(self, tiger):
+        self.tiger_to_pet = tiger
+        self.session = PetSession.for_tiger(tiger)
+        tiger.show_picture(self.pictures.get(tiger.picture_file))
 
-    def pet(self, mouse):
+    def track_pet(self, pos, pressed, now):
+        '''
+        Feeds a mouse position from a mouse event at time now, in seconds,
+        into the petting session.
+        '''
+        if self.session:
+            self.session.track(pos, pressed, now)
+
+    def pet(self, now):
         '''
         Processes all aspects of petting mode: speed of petting, reaction
         of tiger, visual feedback of reaction, and exiting pet mode when
-        resolved.
+        resolved. Called once per tick; the scoring itself is done by the
+        PetSession.
         '''
-        result = None
-        self.petting_time -= 1
-        mouse_pos = mouse.get_pos()
-        mousedown = bool(mouse.get_pressed()[0])
-
-        if mousedown:
-            dist = distance(self.last_pet_pos, mouse_pos)
-            self.last_pet_pos = mouse_pos
-        else:
-            dist = 0
-            self.last_pet_pos = None
-
-        self.distances.insert(0, dist)
-        if len(self.distances) > NUM_PETS:
-            self.distances.pop()
-
-        pet_speed = sum(self.distances) / len(self.distances)
-        self.pet_bar.width = pet_speed * PET_BAR_MOD
+        session = self.session
+        result = session.tick(now)
+        color = PET_REACTION_COLORS[session.reaction]
+        self.pet_bar.width = session.pet_speed * PET_BAR_MOD
         self.pet_bar.pos = PET_BAR_CENTER
+        self.pet_text.update(pos=PET_TEXT_CENTER, string=session.reaction,
+                             color=color)
+        self.pet_bar.fill(color)
 
-        if pet_speed >= self.tiger_to_pet.too_fast:
-            self.grrr_score += abs(pet_speed - self.tiger_to_pet.too_fast)
-            self.pet_text.update(pos=PET_TEXT_CENTER, string=GRRR, color=RED)
-            self.pet_bar.fill(RED)
-        elif pet_speed <= self.tiger_to_pet.too_slow:
-            self.yawn_score += abs(pet_speed - self.tiger_to_pet.too_slow)
-            self.pet_text.update(pos=PET_TEXT_CENTER, string=YAWN,
-                                 color=YELLOW)
-            self.pet_bar.fill(YELLOW)
-        else:
-            self.purr_score += 1 / abs(pet_speed - self.tiger_to_pet.desired_pet_speed)
-            self.pet_text.update(pos=PET_TEXT_CENTER, string=PURR,
-                                 color=ORANGE)
-            self.pet_bar.fill(ORANGE)
-
-        if self.petting_time <= 0:
-            result = PURR
-        elif self.yawn_score >= YAWN_MAX:
-            result = YAWN
-        elif self.grrr_score >= GRRR_MAX:
-            result = GRRR
         if result:
             messages = list(PET_FEEDBACK[result])
-            messages.append('Petting score: {}'.format(int(self.purr_score)))
+            messages.append('Petting score: {}'.format(
+                int(session.purr_score)))
             self.tiger_to_pet.petted = True
+            self.active.remove(self.tiger_to_pet)
+            self.petted_count += 1
+            if self.arrays:
+                self.arrays.deactivate(self.tiger_to_pet)
+            if self.tiger_to_pet.tile:
+                self.tiger_to_pet.tile.remove_tiger(self.tiger_to_pet)
             self.tiger_to_pet.pos = OFFSCREEN
-            self.total_score += self.purr_score
+            self.tiger_to_pet.picture = None
+            self.total_score += session.purr_score
             self.reset()
             return messages
         return None
 
     def tigers_to_pet(self):
-        return [tiger for tiger in self.tigers if not tiger.petted]
+        '''
+        Returns the tigers that are still unpetted. This is the manager's own
+        list, not a copy, so it must not be modified by the caller.
+        '''
+        return self.active
 
-    def collide(self, player):
-        for tiger in self.tigers:
+    def collide(self, player, tile_matrix):
+        '''
+        Checks the player against the tigers on the center tile and the
+        tiles next to it, the only ones close enough to touch the player.
+        '''
+        center = (tile_matrix.center_index, tile_matrix.center_index)
+        candidates = [tiger for tile in tile_matrix.tiles_around(center)
+                      for tiger in tile.tigers_near(player.rect)]
+        if self.arrays:
+            self.arrays.sync(candidates)
+        for tiger in candidates:
             if tiger.collide_rect(player):
-                self.tiger_to_pet = tiger
+                self.start_petting(tiger)
                 return True
         return False
 
+    def prefetch(self, tile_matrix):
+        '''
+        Starts decoding the pictures of the tigers nearest the player, so
+        that petting never has to wait for a decode.
+        '''
+        center = (tile_matrix.center_index, tile_matrix.center_index)
+        nearby = [tiger for tile in tile_matrix.tiles_around(center)
+                  for tiger in tile.tigers]
+        if self.arrays:
+            self.arrays.sync(nearby)
+        nearest = heapq.nsmallest(
+            PICTURE_PREFETCH_COUNT, nearby,
+            key=lambda tiger: distance(tiger.center, CENTER_FRAME_POS))
+        self.pictures.prefetch([tiger.picture_file for tiger in nearest])
+
     def update(self, tile_matrix):
+        if self.prefetch_counter <= 0:
+            self.prefetch(tile_matrix)
+            self.prefetch_counter = PICTURE_PREFETCH_RATE
+        self.prefetch_counter -= TICK
+        if self.arrays:
+            self.arrays.update()
+            return
         for tiger in self.tigers_to_pet():
             tiger.update(tile_matrix)
 
     def move(self, direction):
         direction = mirror_direction(direction)
+        if self.arrays:
+            self.arrays.move(direction)
+            return
         for tiger in self.tigers_to_pet():
             tiger.move(direction)
             tiger.roar.move(direction)
@@ -790,10 +2067,35 @@ class TigerManager(object):
         self.pet_bar.draw(surface)
         self.pet_text.draw(surface)
 
-    def draw(self, surface):
-        for tiger in self.tigers_to_pet():
-            tiger.draw(surface)
-            tiger.roar.draw(surface)
+    def draw(self, surface, tile_matrix):
+        '''
+        Draws the tigers on the tiles around the view and the roars of all
+        tigers, skipping anything that falls outside of the screen. With
+        TigerArrays both are culled in a vectorized pass instead.
+        '''
+        tigers = self.tigers_to_pet()
+        self.culler.reset()
+        if self.arrays:
+            candidates = self.arrays.tigers_in_view()
+        else:
+            candidates = sorted((tiger
+                                 for tile in tile_matrix.tiles_in_view()
+                                 for tiger in tile.tigers),
+                                key=lambda tiger: tiger.index)
+        for tiger in candidates:
+            self.culler.draw(tiger, surface)
+        self.culler.culled += len(tigers) - len(candidates)
+        if self.arrays:
+            roars = self.arrays.roars_in_view()
+            self.culler.culled += len(tigers) - len(roars)
+        else:
+            roars = [tiger.roar for tiger in tigers]
+        for roar in roars:
+            self.culler.draw(roar, surface)
+        PROFILER.count('sprites drawn', self.culler.drawn)
+        PROFILER.count('sprites culled', self.culler.culled)
+
+    def draw_counters(self, surface):
         self.score_counter.draw(surface)
         self.petted_counter.draw(surface)
 
@@ -807,18 +2109,40 @@ class GameState(object):
     '''
     def __init__(self, matrix_size, num_tigers):
         self.matrix_size = matrix_size
-        self.num_tigers = min(((matrix_size ** 2) - 1, num_tigers))
+        self.num_tigers = num_tigers
+        self.loading_text = Text('', DEFAULT_FONT, BLUE, 20,
+                                 pos=LOADING_TEXT_POS)
+        self.pictures = PictureCache()
+        self.world = None
+        self.now = 0.0
+        self.quitting = False  # set once the player quit; ends the loop
+        self.new_game(self.show_loading)
+
+    def new_game(self, progress=None):
+        '''
+        Rolls a new game: tiles, tiger placement and parameters, scores and
+        timers. Whatever was loaded is kept, as the tiles, sprite frames and
+        fonts are cached globally and the tiger pictures and the world's
+        chunk cache belong to the GameState.
+        '''
         self.mode = MESSAGE
         self.message_screen = MessageScreen(START_MENU_MESSAGES,
                                             self.start_game)
-        self.tigers = TigerManager(self.num_tigers)
-        self.tile_matrix = TileMatrix(matrix_size, self.tigers.tigers_to_pet(),
-                                      pos=init_matrix_pos(matrix_size))
+        self.tigers = TigerManager(self.num_tigers, progress, self.pictures)
+        if self.world is None:
+            self.world = World(WORLD_SEED)
+        else:
+            self.world.reset(WORLD_SEED)
+        self.tile_matrix = TileMatrix(self.matrix_size,
+                                      self.tigers.tigers_to_pet(), self.world,
+                                      pos=init_matrix_pos(self.matrix_size))
         self.player = Player(pos=tuple(CENTER_FRAME_POS), alignment=CENTER)
         self.direction_stack = []
         self.direction = None
         self.game_over = False
         self.prev_message_screen = None
+        self.travel = 0.0  # distance walked that hasn't made a whole pixel
+        self.step = (0, 0)  # pixels the world moved in the last tick
 
     def __str__(self):
         return '''
@@ -833,8 +2157,23 @@ class GameState(object):
 
     def reset(self):
         self.direction = None
+        self.step = (0, 0)
         self.message_screen = None
 
+    def show_loading(self, done, total):
+        '''
+        Progress callback for asset loading; keeps the start screen on the
+        display while tiger pictures are still being loaded.
+        '''
+        pg.event.pump()
+        frame = get_frame()
+        frame.fill(BLACK)
+        self.message_screen.draw(frame)
+        self.loading_text.update(pos=LOADING_TEXT_POS,
+                                 string=LOADING_MESSAGE.format(done, total))
+        self.loading_text.draw(frame)
+        present()
+
     def start_prev_message(self):
         self.mode = MESSAGE
         self.message_screen = self.prev_message_screen
@@ -892,6 +2231,17 @@ class GameState(object):
         for event in events:
             if event.type == pg.QUIT or self.keys[pg.K_ESCAPE]:
                 self.quit()
+                return
+            elif event.type == pg.KEYDOWN and event.key == PROFILE_KEY:
+                PROFILER.toggle_hud()
+            elif (event.type in (pg.MOUSEMOTION, pg.MOUSEBUTTONDOWN,
+                                 pg.MOUSEBUTTONUP) and self.mode == PETTING):
+                if event.type == pg.MOUSEMOTION:
+                    pressed = bool(event.buttons[0])
+                else:
+                    pressed = (event.type == pg.MOUSEBUTTONDOWN and
+                               event.button == 1)
+                self.tigers.track_pet(event.pos, pressed, self.now)
             elif hasattr(event, 'key') and event.key in DIRECTIONS.keys():
                 direction = DIRECTIONS[event.key]
                 if event.type == pg.KEYDOWN:
@@ -906,26 +2256,50 @@ class GameState(object):
 
     def move(self, direction):
         self.player.move(direction)
+        self.step = (0, 0)
         if direction:
-            self.tile_matrix.move(direction)
-            self.tigers.move(direction)
-            if self.tigers.collide(self.player):
+            self.travel += MOVE_SPEED * TICK
+            pixels = int(self.travel)
+            self.travel -= pixels
+            if not pixels:
+                return
+            step = (direction[0] * pixels, direction[1] * pixels)
+            self.step = mirror_direction(step)
+            self.tile_matrix.move(step)
+            self.tigers.move(step)
+            if self.tigers.collide(self.player, self.tile_matrix):
                 self.mode = MESSAGE
                 cleanup(self.message_screen)
                 self.message_screen = MessageScreen(BEFORE_PET_MESSAGES,
                                                     self.start_petting)
 
-    def draw(self, surface):
+    def draw(self, surface, alpha=1.0):
+        '''
+        Draws the current mode. alpha is how far into the next tick the
+        frame falls; the world is drawn that far between where it was
+        before the last tick and where it is now.
+        '''
+        start = PROFILER.start()
         if self.mode == MESSAGE:
             self.message_screen.draw(surface)
+            PROFILER.stop('draw message', start)
         elif self.mode == WALKING:
-            self.tile_matrix.draw(surface)
-            self.tigers.draw(surface)
+            offset = tuple(int(round((alpha - 1) * xy)) for xy in self.step)
+            world = ShiftedSurface(surface, offset) if any(offset) else surface
+            self.tile_matrix.draw(world)
+            start = PROFILER.stop('draw tile_matrix', start)
+            self.tigers.draw(world, self.tile_matrix)
+            self.tigers.draw_counters(surface)
+            start = PROFILER.stop('draw tigers', start)
             self.player.draw(surface)
+            PROFILER.stop('draw player', start)
         elif self.mode == PETTING:
             self.tigers.draw_petting(surface)
+            PROFILER.stop('draw petting', start)
 
     def update(self):
+        start = PROFILER.start()
+        phase = 'update ' + self.mode
         if self.keys[H]:
             self.help_me(self.mode, self.message_screen)
         if self.mode == MESSAGE or self.mode == HELP:
@@ -934,7 +2308,7 @@ class GameState(object):
             self.tigers.update(self.tile_matrix)
             self.move(self.direction)
         if self.mode == PETTING:
-            result_messages = self.tigers.pet(self.mouse)
+            result_messages = self.tigers.pet(self.now)
             if result_messages:
                 self.mode = MESSAGE
                 cleanup(self.message_screen)
@@ -949,34 +2323,670 @@ class GameState(object):
                             int(self.tigers.total_score)))
             self.message_screen = MessageScreen(messages,
                                                 self.restart)
+        PROFILER.stop(phase, start)
 
     def restart(self):
-        cleanup(self.tigers)
-        cleanup(self.tile_matrix)
-        cleanup(self.player)
-        cleanup(self.message_screen)
-        self.__init__(self.matrix_size)
+        self.new_game()
 
     def quit(self):
-        pg.quit()
-        sys.exit()
+        '''
+        Ends the game loop after the current frame's events, so that main
+        still closes its files and reports on the run.
+        '''
+        self.quitting = True
+
+
+class ShiftedSurface(object):
+    '''
+    Stands in for a surface, shifting everything blitted onto it by offset.
+    '''
+    def __init__(self, surface, offset):
+        self.surface = surface
+        self.offset = offset
 
+    def blit(self, image, dest, *args):
+        return self.surface.blit(image, (dest[0] + self.offset[0],
+                                         dest[1] + self.offset[1]), *args)
 
-def main():
-    print'wtp main() started'
+
+class DirtyRenderer(object):
+    '''
+    Stands in for the display surface when drawing the GameState. Blits are
+    recorded instead of drawn, then compared with the previous frame so
+    that only regions whose contents changed are cleared, redrawn and
+    passed to present. When too much has changed, e.g. while the
+    world scrolls in walking mode, it falls back to a full frame redraw.
+    '''
+    def __init__(self, surface, background=BLACK):
+        self.surface = surface
+        self.background = background
+        self.screen_rect = surface.get_rect()
+        self.max_area = (self.screen_rect.width * self.screen_rect.height *
+                         DIRTY_RECT_MAX_AREA)
+        self.blits = []
+        self.last_blits = []
+        self.full = True
+
+    def blit(self, image, dest):
+        rect = image.get_rect(topleft=(dest[0], dest[1]))
+        self.blits.append((image, rect))
+        return rect.clip(self.screen_rect)
+
+    def invalidate(self):
+        '''
+        Redraws and presents the whole frame next time, e.g. once the window
+        was uncovered.
+        '''
+        self.full = True
+
+    def dirty_rects(self):
+        current = set((id(image), tuple(rect)) for image, rect in self.blits)
+        last = set((id(image), tuple(rect)) for image, rect in self.last_blits)
+        rects = []
+        for blits, others in ((self.blits, last), (self.last_blits, current)):
+            for image, rect in blits:
+                if (id(image), tuple(rect)) not in others:
+                    rect = rect.clip(self.screen_rect)
+                    if rect.width and rect.height:
+                        rects.append(rect)
+        return rects
+
+    def present(self):
+        '''
+        Draws whatever changed since the last frame and updates the display.
+        Returns the list of rects that were updated.
+        '''
+        rects = [] if self.full else self.dirty_rects()
+        if self.full or sum(r.width * r.height for r in rects) > self.max_area:
+            self.surface.fill(self.background)
+            for image, rect in self.blits:
+                self.surface.blit(image, rect)
+            rects = [self.screen_rect]
+            present()
+            self.full = False
+        elif rects:
+            for dirty in rects:
+                self.surface.set_clip(dirty)
+                self.surface.fill(self.background, dirty)
+                for image, rect in self.blits:
+                    if rect.colliderect(dirty):
+                        self.surface.blit(image, rect)
+            self.surface.set_clip(None)
+            present(rects)
+        self.last_blits = self.blits
+        self.blits = []
+        return rects
+
+
+##############################################
+# Profiling
+
+
+PROFILE_PHASES = ('events', 'update message', 'update walking',
+                  'update petting', 'draw message', 'draw tile_matrix',
+                  'draw tigers', 'draw player', 'draw petting', 'present')
+# tigers and roar labels ViewCuller drew and culled, in frames that drew any
+PROFILE_COUNTERS = ('sprites drawn', 'sprites culled')
+
+
+class FrameProfiler(object):
+    '''
+    Times the phases of each frame. The time between start and stop is
+    added to the named phase of the current frame, and end_frame records
+    the frame: the last window frames are kept for rolling statistics,
+    shown on a HUD toggled with PROFILE_KEY, and every frame can be
+    written to a CSV file. count adds to one of the counters the same way.
+    While disabled, start returns None and stop and count do nothing, so
+    the calls can stay in the game loop.
+    '''
+    def __init__(self, phases=PROFILE_PHASES, counters=PROFILE_COUNTERS,
+                 window=PROFILE_WINDOW):
+        self.phases = tuple(phases) + ('frame',)
+        self.counters = tuple(counters)
+        self.enabled = False
+        self.hud = False
+        self.csv = None
+        self.frame = collections.defaultdict(float)
+        self.counts = {}
+        self.frame_start = None
+        self.frames = 0
+        self.history = {name: collections.deque(maxlen=window)
+                        for name in self.phases + self.counters}
+        self.hud_texts = []
+
+    def __str__(self):
+        return '\n'.join(self.report())
+
+    def update_enabled(self):
+        self.enabled = self.hud or self.csv is not None
+
+    def toggle_hud(self):
+        self.hud = not self.hud
+        self.hud_texts = []
+        self.update_enabled()
+
+    def open_csv(self, filename):
+        '''
+        Writes the time of every phase of every frame, in milliseconds, to
+        a CSV file from now on.
+        '''
+        self.close_csv()
+        self.csv = open(filename, 'w')
+        self.csv.write('frame,{}\n'.format(','.join(self.phases +
+                                                    self.counters)))
+        self.update_enabled()
+
+    def close_csv(self):
+        if self.csv is not None:
+            self.csv.close()
+            self.csv = None
+            self.update_enabled()
+
+    def start(self):
+        if self.enabled:
+            return timeit.default_timer()
+        return None
+
+    def stop(self, phase, start):
+        '''
+        Adds the time since start to phase and returns the current time,
+        which can start the next phase.
+        '''
+        if start is None:
+            return None
+        now = timeit.default_timer()
+        self.frame[phase] += now - start
+        return now
+
+    def count(self, counter, n):
+        '''
+        Adds n to counter for the current frame.
+        '''
+        if self.frame_start is not None:
+            self.counts[counter] = self.counts.get(counter, 0) + n
+
+    def start_frame(self):
+        self.frame.clear()
+        self.counts.clear()
+        self.frame_start = self.start()
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        self.stop('frame', self.frame_start)
+        times = [self.frame.get(phase, 0.0) for phase in self.phases]
+        for phase, time in zip(self.phases, times):
+            self.history[phase].append(time)
+        for counter, n in self.counts.items():
+            self.history[counter].append(n)
+        if self.csv is not None:
+            self.csv.write('{},{}\n'.format(self.frames, ','.join(
+                ['{:.4f}'.format(time * 1000) for time in times] +
+                [str(self.counts.get(counter, '')) for counter in
+                 self.counters])))
+        self.frames += 1
+        self.frame_start = None
+
+    def report(self):
+        lines = ['{:<17}{:>8}{:>8}{:>8}{:>8}'.format('phase ms', 'min', 'avg',
+                                                    'p95', 'p99')]
+        for phase in self.phases:
+            if not self.history[phase]:
+                continue
+            stats = frame_stats(self.history[phase])
+            lines.append('{:<17}{min_ms:>8.3f}{avg_ms:>8.3f}{p95_ms:>8.3f}'
+                         '{p99_ms:>8.3f}'.format(phase, **stats))
+        counts = [(counter, sorted(self.history[counter]))
+                  for counter in self.counters if self.history[counter]]
+        if counts:
+            lines.append('{:<17}{:>8}{:>8}{:>8}{:>8}'.format(
+                'count', 'min', 'avg', 'p95', 'p99'))
+        for counter, values in counts:
+            last = len(values) - 1
+            lines.append('{:<17}{:>8}{:>8.1f}{:>8}{:>8}'.format(
+                counter, values[0], sum(values) / float(len(values)),
+                values[min(int(len(values) * 0.95), last)],
+                values[min(int(len(values) * 0.99), last)]))
+        return lines
+
+    def draw(self, surface):
+        if not self.hud:
+            return
+        if not self.hud_texts or self.frames % PROFILE_HUD_RATE == 0:
+            x, y = PROFILE_HUD_POS
+            self.hud_texts = [
+                Text(line, PROFILE_FONT, WHITE, PROFILE_FONT_HEIGHT,
+                     pos=(x, y + i * PROFILE_FONT_HEIGHT))
+                for i, line in enumerate(self.report())]
+        for text in self.hud_texts:
+            text.draw(surface)
+
+
+PROFILER = FrameProfiler()
+
+
+##############################################
+# Input sources and headless mode
+
+
+class LiveInput(object):
+    '''
+    Reads the real keyboard, mouse and event queue each frame.
+    '''
+    def done(self):
+        return False
+
+    def clock(self):
+        '''
+        Returns the time in seconds, from an arbitrary start.
+        '''
+        return timeit.default_timer()
+
+    def poll(self):
+        return pg.key.get_pressed(), pg.mouse, pg.event.get()
+
+
+class ScriptedKeys(object):
+    '''
+    Stands in for pg.key.get_pressed(), reporting the scripted keys as held.
+    '''
+    def __init__(self, held=()):
+        self.held = frozenset(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+
+class ScriptedMouse(object):
+    '''
+    Stands in for pg.mouse with a scripted position and button state.
+    '''
+    def __init__(self, pos=CENTER_FRAME_POS, pressed=(0, 0, 0)):
+        self.pos = pos
+        self.pressed = pressed
+
+    def get_pos(self):
+        return self.pos
+
+    def get_pressed(self):
+        return self.pressed
+
+    def set_visible(self, visible):
+        pass
+
+
+class ScriptedInput(object):
+    '''
+    Drives a GameState from a script instead of the real keyboard and mouse.
+    The script is a list of steps, each a dict with the number of frames it
+    lasts, the names of the keys held down (as in pg.K_<name>), the mouse
+    positions to cycle through frame by frame and the mouse buttons.
+    KEYDOWN and KEYUP events are generated whenever the held keys change,
+    MOUSEMOTION events whenever the mouse moves and MOUSEBUTTONDOWN and
+    MOUSEBUTTONUP events whenever the buttons change. The clock advances
+    exactly one TICK per frame.
+    '''
+    def __init__(self, script):
+        self.steps = list(script)
+        self.step_i = 0
+        self.frame_i = 0
+        self.frames = 0
+        self.held = frozenset()
+        self.mouse = ScriptedMouse()
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls(json.load(f))
+
+    def done(self):
+        return self.step_i >= len(self.steps)
+
+    def clock(self):
+        return self.frames * TICK
+
+    def mouse_events(self, mouse):
+        events = []
+        for button, (was, now) in enumerate(zip(self.mouse.pressed,
+                                                 mouse.pressed)):
+            if was != now:
+                events.append(pg.event.Event(
+                    pg.MOUSEBUTTONDOWN if now else pg.MOUSEBUTTONUP,
+                    pos=mouse.pos, button=button + 1))
+        if mouse.pos != self.mouse.pos:
+            rel = (mouse.pos[0] - self.mouse.pos[0],
+                   mouse.pos[1] - self.mouse.pos[1])
+            events.append(pg.event.Event(pg.MOUSEMOTION, pos=mouse.pos,
+                                         rel=rel, buttons=mouse.pressed))
+        self.mouse = mouse
+        return events
+
+    def poll(self):
+        step = self.steps[self.step_i]
+        held = frozenset(getattr(pg, 'K_' + name)
+                         for name in step.get('keys', ()))
+        events = [pg.event.Event(pg.KEYUP, key=key)
+                  for key in self.held - held]
+        events += [pg.event.Event(pg.KEYDOWN, key=key)
+                   for key in held - self.held]
+        self.held = held
+        path = step.get('mouse', [CENTER_FRAME_POS])
+        mouse = ScriptedMouse(tuple(path[self.frame_i % len(path)]),
+                              tuple(step.get('buttons', (0, 0, 0))))
+        events += self.mouse_events(mouse)
+        self.frame_i += 1
+        self.frames += 1
+        if self.frame_i >= step['frames']:
+            self.step_i += 1
+            self.frame_i = 0
+        return ScriptedKeys(held), mouse, events
+
+
+RECORDING_VERSION = 1
+# the only keys GameState reads from the held key state
+RECORDED_KEYS = sorted(set((SPACE, H, ESCAPE) + tuple(DIRECTIONS)))
+# the events GameState handles and the attributes it reads from them
+RECORDED_EVENTS = {pg.QUIT: (),
+                   pg.KEYDOWN: ('key',),
+                   pg.KEYUP: ('key',),
+                   pg.MOUSEMOTION: ('pos', 'rel', 'buttons'),
+                   pg.MOUSEBUTTONDOWN: ('pos', 'button'),
+                   pg.MOUSEBUTTONUP: ('pos', 'button')}
+
+
+class Recorder(object):
+    '''
+    Wraps an input source, passing its input on to the game while writing
+    every frame of it to a gzipped file of JSON lines: a header with the
+    seed the game's random state was started from and the Python version,
+    then one line per frame with the clock, the held keys, the mouse and
+    the events. ReplayInput plays the file back exactly.
+    '''
+    def __init__(self, source, filename, seed):
+        self.source = source
+        self.file = gzip.open(filename, 'wb')
+        self.write({'version': RECORDING_VERSION, 'seed': seed,
+                    'python': list(sys.version_info[:2]),
+                    'pygame': pg.version.ver})
+        self.start = None
+        self.now = 0.0
+
+    def write(self, line):
+        self.file.write((json.dumps(line, separators=(',', ':')) +
+                         '\n').encode('utf-8'))
+
+    def done(self):
+        return self.source.done()
+
+    def clock(self):
+        '''
+        Returns the source's clock as of the last poll, counted from the
+        first call and rounded as recorded, so that the recorded game sees
+        exactly the times the replayed one will.
+        '''
+        if self.start is None:
+            self.start = self.source.clock()
+        return self.now
+
+    def poll(self):
+        keys, mouse, events = self.source.poll()
+        if self.start is None:
+            self.start = self.source.clock()
+        self.now = round(self.source.clock() - self.start, 6)
+        self.write([self.now,
+                    [key for key in RECORDED_KEYS if keys[key]],
+                    list(mouse.get_pos()), list(mouse.get_pressed()),
+                    [[event.type, {name: getattr(event, name)
+                                   for name in RECORDED_EVENTS[event.type]}]
+                     for event in events if event.type in RECORDED_EVENTS]])
+        return keys, mouse, events
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayInput(object):
+    '''
+    Plays a file written by Recorder back into a GameState frame by frame,
+    with the recorded clock, so the game ticks exactly as it did when it
+    was recorded. The game must be started from the recorded seed, on the
+    same major version of Python: random rolls differently on Python 2 and
+    3, so the game would diverge from the recording.
+    '''
+    def __init__(self, header, frames):
+        if header.get('version') != RECORDING_VERSION:
+            raise ValueError('Unsupported recording version: {}'.format(
+                header.get('version')))
+        python = header.get('python')
+        if python is None:
+            print('Warning: the recording does not say which Python made '
+                  'it; it only replays exactly on the same major version')
+        elif python[0] != sys.version_info[0]:
+            raise ValueError(
+                'Recorded on Python {}, which rolls random numbers '
+                'differently from Python {}; replay it on Python {}'.format(
+                    '.'.join(map(str, python)),
+                    '.'.join(map(str, sys.version_info[:2])), python[0]))
+        self.seed = header['seed']
+        self.frames = frames
+        self.frame_i = 0
+        self.now = 0.0
+
+    @classmethod
+    def load(cls, filename):
+        with gzip.open(filename, 'rb') as f:
+            lines = [json.loads(line.decode('utf-8')) for line in f]
+        return cls(lines[0], lines[1:])
+
+    def done(self):
+        return self.frame_i >= len(self.frames)
+
+    def clock(self):
+        return self.now
+
+    def poll(self):
+        self.now, keys, pos, pressed, events = self.frames[self.frame_i]
+        self.frame_i += 1
+        events = [pg.event.Event(event_type, {
+            name: tuple(value) if isinstance(value, list) else value
+            for name, value in attrs.items()})
+            for event_type, attrs in events]
+        return (ScriptedKeys(keys), ScriptedMouse(tuple(pos), tuple(pressed)),
+                events)
+
+
+# Holds space to get through every message screen, walks in each direction
+# in turn and keeps the mouse button down, wiggling enough to pet.
+DEMO_SCRIPT = [{'frames': 60, 'keys': ['SPACE']}] + [
+    {'frames': 600,
+     'keys': ['SPACE', direction],
+     'mouse': [(CENTER_FRAME_X, CENTER_FRAME_Y),
+               (CENTER_FRAME_X + 6, CENTER_FRAME_Y),
+               (CENTER_FRAME_X + 6, CENTER_FRAME_Y + 7)],
+     'buttons': [1, 0, 0]}
+    for direction in ('LEFT', 'UP', 'RIGHT', 'DOWN') * 2]
+
+
+def frame_stats(frame_times):
+    '''
+    Summarizes a list of frame durations in seconds.
+    '''
+    times = sorted(frame_times)
+    total = sum(times)
+
+    def percentile(p):
+        return times[min(int(len(times) * p / 100.0), len(times) - 1)]
+
+    return {'frames': len(times),
+            'fps': len(times) / total if total else 0.0,
+            'avg_ms': total / len(times) * 1000,
+            'min_ms': times[0] * 1000,
+            'p50_ms': percentile(50) * 1000,
+            'p95_ms': percentile(95) * 1000,
+            'p99_ms': percentile(99) * 1000,
+            'max_ms': times[-1] * 1000}
+
+
+def print_frame_stats(frame_times):
+    stats = frame_stats(frame_times)
+    print('{frames} frames, {fps:.1f} frames per second'.format(**stats))
+    print('frame ms: avg {avg_ms:.3f}  min {min_ms:.3f}  p50 {p50_ms:.3f}  '
+          'p95 {p95_ms:.3f}  p99 {p99_ms:.3f}  max {max_ms:.3f}'.format(
+              **stats))
+
+
+def main(input_source=None, headless=False, seed=None, record=None,
+         fullscreen=FULLSCREEN, scale_mode=SCALE_MODE):
+    '''
+    Runs the game loop. The game is simulated in fixed ticks of TICK
+    seconds, running every tick that came due since the last frame, then
+    rendered once, interpolated between the last two ticks. A machine that
+    can't keep up renders fewer frames but still simulates every tick.
+    Rendering is capped at FPS, and a frame that changes nothing on the
+    screen waits for the next tick instead. Headless runs are driven by a
+    scripted input source, aren't capped at FPS, and print frame timings
+    when the script ends. The random state is seeded with seed, or a
+    random seed, and the session can be recorded to the file named by
+    record. The game renders at FRAME_WIDTH by FRAME_HEIGHT whatever the
+    window size, scaled to it by scale_mode; headless runs have no window
+    to scale to.
+    '''
+    init(headless)
+    if headless:
+        frame = get_frame(scale_mode=UNSCALED)
+    else:
+        frame = get_frame(fullscreen, scale_mode)
+    print('wtp main() started')
+    print('rendering at {}x{}'.format(FRAME_WIDTH, FRAME_HEIGHT))
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    print('random seed: {}'.format(seed))
+    random.seed(seed)
     fps_clock = pg.time.Clock()
     game_state = GameState(DEFAULT_TILE_MATRIX_SIZE, DEFAULT_NUM_TIGERS)
     print(str(game_state))
+    # every tile is read while the game starts; any read after that is a
+    # miss while playing
+    tiles_loaded = TILE_CACHE.stats()
+    renderer = DirtyRenderer(frame) if DIRTY_RECT_RENDERING else None
+    if input_source is None:
+        input_source = ScriptedInput(DEMO_SCRIPT) if headless else LiveInput()
+    if record:
+        input_source = Recorder(input_source, record, seed)
+    frame_times = []
+    start_time = input_source.clock()
+    ticks = 0
+    mode = game_state.mode
+
+    try:
+        while not input_source.done():
+            start = timeit.default_timer()
+            PROFILER.start_frame()
+            game_state.keys, game_state.mouse, events = input_source.poll()
+            game_state.now = input_source.clock()
+            if renderer and any(event.type in REDRAW_EVENTS
+                                for event in events):
+                renderer.invalidate()
+            phase_start = PROFILER.start()
+            game_state.process_events(events)
+            PROFILER.stop('events', phase_start)
+            if game_state.quitting:
+                break
+            # the small epsilon keeps float rounding from delaying a tick
+            due = (game_state.now - start_time) * TICK_RATE
+            while ticks < int(due + 1e-6):
+                game_state.update()
+                ticks += 1
+            alpha = min(max(due - ticks, 0.0), 1.0)
+            if renderer and game_state.mode != mode:
+                # a new mode, or a new game, redraws the whole frame
+                renderer.invalidate()
+            mode = game_state.mode
+            if renderer:
+                game_state.draw(renderer, alpha)
+                PROFILER.draw(renderer)
+                phase_start = PROFILER.start()
+                changed = renderer.present()
+            else:
+                frame.fill(BLACK)
+                game_state.draw(frame, alpha)
+                PROFILER.draw(frame)
+                phase_start = PROFILER.start()
+                present()
+                changed = True
+            PROFILER.stop('present', phase_start)
+            PROFILER.end_frame()
+            if headless:
+                frame_times.append(timeit.default_timer() - start)
+                continue
+            if not changed:
+                # nothing on the screen changed, and nothing will before
+                # the next tick, e.g. on a message screen
+                next_tick = start_time + (ticks + 1) * TICK
+                pg.time.wait(max(int(
+                    (next_tick - input_source.clock()) * 1000), 0))
+            fps_clock.tick(FPS)
+    finally:
+        if record:
+            input_source.close()
+        PROFILER.close_csv()
+
+    if frame_times:
+        print_frame_stats(frame_times)
+        tiles = TILE_CACHE.stats()
+        print('tile cache: {} tiles, {} hits, {} misses while playing'.format(
+            tiles['tiles'], tiles['hits'] - tiles_loaded['hits'],
+            tiles['misses'] - tiles_loaded['misses']))
+        if PROFILER.frames:
+            print(PROFILER)
 
-    while True:
-        FRAME.fill(BLACK)
-        game_state.keys = pg.key.get_pressed()
-        game_state.mouse = pg.mouse
-        game_state.process_events(pg.event.get())
-        game_state.update()
-        game_state.draw(FRAME)
-        pg.display.update()
-        fps_clock.tick(FPS)
 
 if __name__ == '__main__':
-    main()
+    # only the command line needs argparse; it would slow down every import
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Wild Tiger Petter',
+        epilog='The game renders at {}x{}; set {} to WIDTHxHEIGHT to render '
+               'at another size.'.format(FRAME_WIDTH, FRAME_HEIGHT,
+                                         RENDER_SIZE_VAR))
+    parser.add_argument('--build-assets', action='store_true',
+                        help='build the asset bundle and exit')
+    parser.add_argument('--headless', action='store_true',
+                        help='run without a window, driven by a script')
+    parser.add_argument('--script',
+                        help='JSON input script for headless runs')
+    parser.add_argument('--profile', action='store_true',
+                        help='start with the profiler HUD shown')
+    parser.add_argument('--profile-csv', metavar='FILE',
+                        help='write per frame phase timings to a CSV file')
+    parser.add_argument('--seed', type=int,
+                        help='seed for the random state of the game')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record the session to a file for --replay')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='replay a recorded session headless')
+    parser.add_argument('--fullscreen', action='store_true',
+                        help='full screen, the game scaled to fit')
+    parser.add_argument('--scale', choices=SCALE_MODES, default=SCALE_MODE,
+                        help='how to scale the game to the window '
+                             '(default %(default)s); sharp repeats pixels a '
+                             'whole number of times, except in full screen')
+    args = parser.parse_args()
+    window = dict(fullscreen=args.fullscreen, scale_mode=args.scale)
+    if args.profile:
+        PROFILER.toggle_hud()
+    if args.profile_csv:
+        PROFILER.open_csv(args.profile_csv)
+    if args.build_assets:
+        ASSETS.build()
+    elif args.replay:
+        try:
+            replay = ReplayInput.load(args.replay)
+        except ValueError as e:
+            parser.error(str(e))
+        main(replay, headless=True, seed=replay.seed, record=args.record,
+             **window)
+    else:
+        main(ScriptedInput.load(args.script) if args.script else None,
+             headless=args.headless, seed=args.seed, record=args.record,
+             **window)